@@ -1,8 +1,22 @@
-import json, os, datetime as dt, uuid
+import hashlib, json, os, time, datetime as dt, uuid
 from copy import deepcopy
+from pathlib import Path
 from typing import Dict, List, Optional
 
+from services.file_lock import FileLock, lock_path_for
+
 DB_FILE = "macroentreno.json"
+# Food usage scores halve after this many days without logging the food again.
+FOOD_USAGE_HALF_LIFE_DAYS = 14.0
+_usage_cache: Dict = {"mtime": None, "scores": {}}
+# Recent diary entries and foods live in a small sidecar file so reading them never loads the diary.
+RECENT_ENTRIES_SIZE = 12
+RECENT_FOODS_SIZE = 8
+FREQUENT_FOODS_SIZE = 32
+_recent_cache: Dict = {"mtime": None, "state": None}
+_recent_locks: Dict[str, FileLock] = {}
+# Digest of the custom foods, recomputed only when the DB file changes.
+_custom_foods_cache: Dict = {"mtime": None, "version": None}
 
 def _load() -> Dict:
     if not os.path.exists(DB_FILE):
@@ -11,6 +25,7 @@ def _load() -> Dict:
             "workouts": [],
             "user": {"name": "Alexis", "kcal_goal": 1800},
             "custom_foods": [],
+            "food_usage": {},
         }
     with open(DB_FILE, "r", encoding="utf-8") as f:
         data = json.load(f)
@@ -27,6 +42,9 @@ def _load() -> Dict:
     if "custom_foods" not in data:
         data["custom_foods"] = []
         changed = True
+    if "food_usage" not in data:
+        data["food_usage"] = _build_food_usage(data["diary"])
+        changed = True
     if changed:
         _save(data)
     return data
@@ -64,6 +82,74 @@ def _normalise_macros(kcal, p, c, g) -> Dict:
         "g": float(g or 0.0),
     }
 
+def _decayed_usage(usage: Dict, now: float) -> float:
+    elapsed_days = max(now - float(usage.get("last") or 0.0), 0.0) / 86400.0
+    return float(usage.get("score") or 0.0) * 0.5 ** (elapsed_days / FOOD_USAGE_HALF_LIFE_DAYS)
+
+def _record_food_usage(data: Dict, food_id: str, when: float):
+    usage = data.setdefault("food_usage", {})
+    current = usage.get(food_id) or {}
+    usage[food_id] = {
+        "score": _decayed_usage(current, when) + 1.0,
+        "count": int(current.get("count") or 0) + 1,
+        "last": max(when, float(current.get("last") or 0.0)),
+    }
+
+def _forget_food_usage(data: Dict, food_id: str, when: float):
+    # Takes back one logged entry: its share of the score, decayed from when it was logged to the last use.
+    usage = data.setdefault("food_usage", {})
+    current = usage.get(food_id)
+    if not current:
+        return
+    count = int(current.get("count") or 0) - 1
+    if count <= 0:
+        del usage[food_id]
+    else:
+        last = float(current.get("last") or 0.0)
+        share = 0.5 ** (max(last - when, 0.0) / 86400.0 / FOOD_USAGE_HALF_LIFE_DAYS)
+        usage[food_id] = {
+            "score": max(float(current.get("score") or 0.0) - share, 0.0),
+            "count": count,
+            "last": last,
+        }
+
+def _entry_time(entry: Dict) -> Optional[float]:
+    # Diary entries only keep their date; they count from noon, or now for today's morning.
+    try:
+        day = dt.datetime.fromisoformat(str(entry.get("date")))
+    except ValueError:
+        return None
+    return min(day.replace(hour=12).timestamp(), time.time())
+
+def _build_food_usage(diary: List[Dict]) -> Dict:
+    # One-off backfill for files written before usage was tracked.
+    data = {"food_usage": {}}
+    dated = []
+    for entry in diary:
+        food_id = (entry.get("food") or {}).get("id")
+        when = _entry_time(entry) if food_id else None
+        if when is None:
+            continue
+        dated.append((when, food_id))
+    for when, food_id in sorted(dated):
+        _record_food_usage(data, food_id, when)
+    return data["food_usage"]
+
+def get_food_usage_scores() -> Dict[str, float]:
+    """
+    Decayed frequency/recency score per logged food id, cached until the DB file changes.
+    """
+    try:
+        mtime = os.stat(DB_FILE).st_mtime_ns
+    except OSError:
+        return {}
+    if _usage_cache["mtime"] != mtime:
+        now = time.time()
+        usage = _load().get("food_usage", {})
+        _usage_cache["scores"] = {food_id: _decayed_usage(item, now) for food_id, item in usage.items()}
+        _usage_cache["mtime"] = mtime
+    return _usage_cache["scores"]
+
 def add_food_entry(date, meal_type, name, grams, kcal, p, c, g, micros=None, food_ref=None, entry_id=None):
     data = _load()
     entry = {
@@ -76,11 +162,14 @@ def add_food_entry(date, meal_type, name, grams, kcal, p, c, g, micros=None, foo
     }
     if food_ref:
         entry["food"] = food_ref
+        if food_ref.get("id"):
+            _record_food_usage(data, str(food_ref["id"]), time.time())
     if entry_id:
         entry["entry_id"] = entry_id
     _ensure_entry_id(entry)
     data["diary"].append(entry)
     _save(data)
+    _remember_entry(entry)
 
 def get_day_entries(date):
     data = _load()
@@ -100,14 +189,151 @@ def get_day_entries(date):
         _save(data)
     return result
 
+def _recent_file() -> str:
+    return f"{os.path.splitext(DB_FILE)[0]}_recent.json"
+
+def _recent_lock() -> FileLock:
+    # The app and the CLI may both update the sidecar; their read-modify-writes take turns.
+    path = _recent_file()
+    if path not in _recent_locks:
+        _recent_locks[path] = FileLock(lock_path_for(Path(path)))
+    return _recent_locks[path]
+
+def _empty_recent_state() -> Dict:
+    # entries/foods are newest-first ring buffers; frequent is a Space-Saving sketch
+    # {food_id: {"count", "error", "food"}} holding at most FREQUENT_FOODS_SIZE foods.
+    return {"entries": [], "foods": [], "frequent": {}}
+
+def _recent_state() -> Dict:
+    path = _recent_file()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    if _recent_cache["state"] is not None and _recent_cache["mtime"] == mtime:
+        return _recent_cache["state"]
+    state = None
+    if mtime is not None:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+    if not isinstance(state, dict):
+        # First run with this file: seed the buffer from the diary once.
+        state = _empty_recent_state()
+        if os.path.exists(DB_FILE):
+            diary = _load().get("diary", [])
+            state["entries"] = [deepcopy(entry) for entry in reversed(diary[-RECENT_ENTRIES_SIZE:])]
+        _save_recent(state)
+        return state
+    for key, value in _empty_recent_state().items():
+        state.setdefault(key, value)
+    _recent_cache.update(state=state, mtime=mtime)
+    return state
+
+def _save_recent(state: Dict):
+    path = _recent_file()
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    _recent_cache.update(state=state, mtime=mtime)
+
+def _push_recent(items: List[Dict], item: Dict, key, size: int) -> List[Dict]:
+    return ([item] + [other for other in items if key(other) != key(item)])[:size]
+
+def _count_frequent(state: Dict, food_id: str, food: Optional[Dict] = None):
+    sketch = state["frequent"]
+    counter = sketch.get(food_id)
+    if counter is None:
+        if len(sketch) >= FREQUENT_FOODS_SIZE:
+            # Space-Saving: the newcomer replaces the least counted food and inherits its count as error.
+            victim_id = min(sketch, key=lambda key: sketch[key]["count"])
+            victim = sketch.pop(victim_id)
+            counter = {"count": victim["count"], "error": victim["count"], "food": None}
+        else:
+            counter = {"count": 0, "error": 0, "food": None}
+        sketch[food_id] = counter
+    counter["count"] += 1
+    if food is not None:
+        counter["food"] = food
+
+def _remember_entry(entry: Dict):
+    with _recent_lock().locked():
+        state = _recent_state()
+        state["entries"] = _push_recent(state["entries"], deepcopy(entry), lambda item: item.get("entry_id"), RECENT_ENTRIES_SIZE)
+        food_id = (entry.get("food") or {}).get("id")
+        if food_id:
+            # Only logged entries count; the snapshot comes from the catalogue pick, when there was one.
+            picked = next((food for food in state["foods"] if food.get("id") == food_id), None)
+            _count_frequent(state, str(food_id), deepcopy(picked) if picked else None)
+        _save_recent(state)
+
+def _forget_entry(entry_id, replacement: Optional[Dict] = None, diary: Optional[List[Dict]] = None):
+    # Without a replacement the entry is dropped and the buffer refilled from ``diary``, newest first.
+    with _recent_lock().locked():
+        state = _recent_state()
+        entries = state["entries"]
+        for idx, item in enumerate(entries):
+            if item.get("entry_id") == entry_id:
+                break
+        else:
+            return
+        if replacement is not None:
+            entries[idx] = deepcopy(replacement)
+        else:
+            del entries[idx]
+            kept = {item.get("entry_id") for item in entries}
+            for entry in reversed(diary or []):
+                if len(entries) >= RECENT_ENTRIES_SIZE:
+                    break
+                if entry.get("entry_id") not in kept:
+                    entries.append(deepcopy(entry))
+        _save_recent(state)
+
 def get_recent_entries(limit: int = 4):
-    data = _load()
-    diary = data.get("diary", [])
     if limit <= 0:
         return []
-    recent = diary[-limit:]
-    recent_reversed = list(reversed(recent))
-    return [deepcopy(entry) for entry in recent_reversed]
+    return [deepcopy(entry) for entry in _recent_state()["entries"][:limit]]
+
+def record_recent_food(food: Dict):
+    """
+    Remembers a food picked in the catalogue (newest first). Picking does not count as
+    use: frequency is counted when an entry is logged, which also stores this snapshot.
+    """
+    identifier = food.get("id") or food.get("name")
+    if not identifier:
+        return
+    snapshot = deepcopy(food)
+    with _recent_lock().locked():
+        state = _recent_state()
+        state["foods"] = _push_recent(
+            state["foods"], snapshot, lambda item: item.get("id") or item.get("name"), RECENT_FOODS_SIZE
+        )
+        counter = state["frequent"].get(str(identifier))
+        if counter is not None:
+            counter["food"] = deepcopy(snapshot)
+        _save_recent(state)
+
+def get_recent_foods(limit: int = 3) -> List[Dict]:
+    return [deepcopy(food) for food in _recent_state()["foods"][:limit]]
+
+def get_frequent_foods(limit: int = 3) -> List[Dict]:
+    """
+    Most logged catalogue foods, by guaranteed count (count - error).
+    """
+    sketch = _recent_state()["frequent"]
+    ranked = sorted(
+        (counter for counter in sketch.values() if counter.get("food")),
+        key=lambda counter: counter["count"] - counter["error"],
+        reverse=True,
+    )
+    return [deepcopy(counter["food"]) for counter in ranked[:limit]]
 
 def get_week_entries(end_date, days=7):
     data = _load()
@@ -277,6 +503,7 @@ def update_food_entry(entry_id, *, name=None, meal=None, grams=None, kcal=None,
     updated = False
     for entry in data["diary"]:
         if entry.get("entry_id") == entry_id:
+            previous_id = (entry.get("food") or {}).get("id")
             if name is not None:
                 entry["name"] = name
             if meal is not None:
@@ -295,19 +522,33 @@ def update_food_entry(entry_id, *, name=None, meal=None, grams=None, kcal=None,
                 entry["micros"] = micros
             if food_ref is not None:
                 entry["food"] = food_ref
+                current_id = food_ref.get("id")
+                if current_id != previous_id:
+                    # The entry now counts for another food.
+                    when = _entry_time(entry) or time.time()
+                    if previous_id:
+                        _forget_food_usage(data, str(previous_id), when)
+                    if current_id:
+                        _record_food_usage(data, str(current_id), when)
             updated = True
             break
     if updated:
         _save(data)
+        _forget_entry(entry_id, replacement=entry)
     return updated
 
 def delete_food_entry(entry_id):
     data = _load()
-    before = len(data["diary"])
+    removed_entries = [entry for entry in data["diary"] if entry.get("entry_id") == entry_id]
     data["diary"] = [entry for entry in data["diary"] if entry.get("entry_id") != entry_id]
-    removed = len(data["diary"]) != before
+    removed = bool(removed_entries)
+    for entry in removed_entries:
+        food_id = (entry.get("food") or {}).get("id")
+        if food_id:
+            _forget_food_usage(data, str(food_id), _entry_time(entry) or time.time())
     if removed:
         _save(data)
+        _forget_entry(entry_id, diary=data["diary"])
     return removed
 
 def list_custom_foods() -> List[Dict]:
@@ -335,6 +576,21 @@ def list_custom_foods() -> List[Dict]:
         _save(data)
     return deepcopy(custom_foods)
 
+def custom_foods_version() -> Optional[str]:
+    """
+    Changes whenever a custom food is created, updated or deleted, by this or any other
+    process or by hand; lets callers key caches on it. Unrelated writes leave it alone.
+    """
+    try:
+        mtime = os.stat(DB_FILE).st_mtime_ns
+    except OSError:
+        return None
+    if _custom_foods_cache["mtime"] != mtime:
+        payload = json.dumps(_load().get("custom_foods", []), sort_keys=True, ensure_ascii=False)
+        _custom_foods_cache["version"] = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+        _custom_foods_cache["mtime"] = mtime
+    return _custom_foods_cache["version"]
+
 def get_custom_food(food_id: str) -> Optional[Dict]:
     if not food_id:
         return None
@@ -344,7 +600,7 @@ def get_custom_food(food_id: str) -> Optional[Dict]:
             return food
     return None
 
-def create_custom_food(name: str, grams: float, kcal: float, p: float, c: float, g: float, description: Optional[str] = None) -> Dict:
+def create_custom_food(name: str, grams: float, kcal: float, p: float, c: float, g: float, description: Optional[str] = None, barcode: Optional[str] = None) -> Dict:
     data = _load()
     custom_foods = data.setdefault("custom_foods", [])
     food = {
@@ -353,12 +609,14 @@ def create_custom_food(name: str, grams: float, kcal: float, p: float, c: float,
         "portion": _normalise_portion(grams, description),
         "macros": _normalise_macros(kcal, p, c, g),
     }
+    if barcode:
+        food["barcode"] = str(barcode).strip()
     _ensure_custom_food_id(food)
     custom_foods.append(food)
     _save(data)
     return deepcopy(food)
 
-def update_custom_food(food_id: str, *, name: Optional[str] = None, grams: Optional[float] = None, kcal: Optional[float] = None, p: Optional[float] = None, c: Optional[float] = None, g: Optional[float] = None, description: Optional[str] = None) -> Optional[Dict]:
+def update_custom_food(food_id: str, *, name: Optional[str] = None, grams: Optional[float] = None, kcal: Optional[float] = None, p: Optional[float] = None, c: Optional[float] = None, g: Optional[float] = None, description: Optional[str] = None, barcode: Optional[str] = None) -> Optional[Dict]:
     data = _load()
     custom_foods = data.setdefault("custom_foods", [])
     updated_food: Optional[Dict] = None
@@ -381,6 +639,12 @@ def update_custom_food(food_id: str, *, name: Optional[str] = None, grams: Optio
                 macros["c"] = float(c)
             if g is not None:
                 macros["g"] = float(g)
+            if barcode is not None:
+                # An empty string removes the barcode.
+                if barcode.strip():
+                    food["barcode"] = barcode.strip()
+                else:
+                    food.pop("barcode", None)
             updated_food = deepcopy(food)
             break
     if updated_food:
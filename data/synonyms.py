@@ -0,0 +1,52 @@
+FOOD_SYNONYMS = {
+    # Catalogue term (as written in data/foods.json) -> regional Spanish and English equivalents.
+    # Proteinas
+    "pollo pechuga": ["pechuga de pollo", "pechuga", "chicken breast"],
+    "pollo": ["chicken"],
+    "huevo": ["huevos", "egg", "eggs"],
+    "clara de huevo": ["claras", "clara", "egg white", "egg whites"],
+    "yogur": ["yogurt", "yoghurt", "yogures"],
+    "yogur griego": ["greek yogurt", "greek yoghurt"],
+    # Cereales y legumbres
+    "arroz": ["rice"],
+    "arroz integral": ["brown rice", "whole grain rice"],
+    "arroz basmati": ["basmati rice", "basmati"],
+    "arroz jazmín": ["arroz jazmin", "jasmine rice"],
+    "avena": ["oats", "oatmeal", "rolled oats", "copos de avena"],
+    "quinoa": ["quinua"],
+    "lenteja": ["lentejas", "lentil", "lentils"],
+    # Pastas
+    "fideos": ["pasta", "noodles", "macarrones"],
+    "spaghetti": ["espagueti", "espaguetis", "spaguetti", "tallarines"],
+    "ñoquis": ["noquis", "gnocchi"],
+    "ravioles": ["ravioli", "raviolis"],
+    "canelones": ["cannelloni", "canelon"],
+    "sorrentinos": ["sorrentino"],
+    # Verduras
+    "batata": ["camote", "boniato", "sweet potato"],
+    "papa": ["patata", "potato", "potatoes"],
+    "palta": ["aguacate", "avocado"],
+    # Frutas
+    "banana": ["plátano", "platano", "guineo", "cambur", "bananas"],
+    "manzana": ["apple", "apples"],
+    "pera": ["pear", "pears"],
+    "naranja": ["orange", "oranges"],
+    "mandarina": ["tangerine", "mandarin"],
+    "pomelo": ["toronja", "grapefruit"],
+    "uva": ["uvas", "grape", "grapes"],
+    "durazno": ["melocotón", "melocoton", "peach"],
+    "ciruela": ["plum"],
+    "sandia": ["sandía", "watermelon"],
+    "melon": ["melón", "cantaloupe"],
+    "frutilla": ["fresa", "fresas", "strawberry", "strawberries"],
+    "arandano": ["arándano", "arándanos", "arandanos", "blueberry", "blueberries"],
+    "frambuesa": ["raspberry", "raspberries"],
+    "anana": ["ananá", "piña", "pina", "pineapple"],
+    "papaya": ["mamón", "mamon", "lechosa"],
+    # Galletitas y bebidas
+    "galletitas": ["galletas", "galletita", "cookies", "crackers", "biscuits"],
+    "alfajor": ["alfajores"],
+    "gaseosa": ["refresco", "soda", "soft drink"],
+    "agua": ["water"],
+    "limon": ["limón", "lemon"],
+}
@@ -1,4 +1,6 @@
+import asyncio
 import datetime as dt
+import threading
 from copy import deepcopy
 from typing import Optional
 import flet as ft
@@ -12,22 +14,31 @@ from data.storage import (
     delete_food_entry,
     get_custom_food,
     get_day_entries,
+    get_frequent_foods,
     get_recent_entries,
+    get_recent_foods,
     list_custom_foods,
+    record_recent_food,
     update_custom_food,
     update_food_entry,
 )
 from services.foods import (
     describe_portion,
+    expand_servings,
     format_macros,
+    lookup_barcode,
+    promote_food,
     scale_macros,
-    search_foods,
+    scale_macros_each,
+    search_foods_fanout,
+    search_foods_fanout_async,
     search_local_foods,
 )
+from services.barcodes import normalise_barcode
 from services.platform_locations import (
-    get_platform_locale_summary,
+    get_cached_platform_locale_summary,
     PlatformLocationConfigError,
-    PlatformLocationError,
+    revalidate_platform_locales,
 )
 
 
@@ -88,6 +99,11 @@ MACRO_CARD_STYLES = [
     },
 ]
 
+# Pausa desde la ultima tecla antes de lanzar la busqueda en el catalogo.
+SEARCH_DEBOUNCE_SECONDS = 0.25
+# Recent/frequent foods read from storage before filtering them by catalogue mode.
+RECENT_FOODS_LIMIT = 8
+
 QUICK_CARD_BG = "#1F1F21"
 CUSTOM_CARD_BG = "#1C1C1E"
 NUTRIENT_LABELS = {
@@ -130,44 +146,54 @@ def MacrosView():
     entries_column = ft.Column(spacing=12)
     totals_info_text = ft.Text("", size=13, color=TEXT_MUTED)
     macro_summary_column = ft.Column(spacing=10)
-    recent_searches: list[dict] = []
-
-    try:
-        locale_summaries = get_platform_locale_summary(limit=6)
-        locale_error = None
-    except PlatformLocationConfigError:
-        locale_summaries = []
-        locale_error = "Configura FATSECRET_PLATFORM_CLIENT_ID y FATSECRET_PLATFORM_CLIENT_SECRET para ver localizaciones."
-    except PlatformLocationError as exc:
-        locale_summaries = []
-        locale_error = str(exc)
-
-    localization_section: Optional[ft.Container] = None
-    if locale_summaries or locale_error:
-        locale_texts: list[ft.Control] = []
-        if locale_summaries:
-            for item in locale_summaries:
-                locale_texts.append(ft.Text(item, size=12, color=TEXT_PRIMARY))
-        elif locale_error:
-            locale_texts.append(ft.Text(locale_error, size=12, color=TEXT_MUTED))
-
-        localization_section = ft.Container(
-            bgcolor=CARD_BG,
-            border_radius=12,
-            padding=12,
-            content=ft.Column(
-                [
-                    ft.Text(
-                        "Localizaciones disponibles (Platform)",
-                        size=14,
-                        weight=ft.FontWeight.W_600,
-                        color=TEXT_PRIMARY,
-                    ),
-                    ft.Column(locale_texts, spacing=4),
-                ],
-                spacing=8,
-            ),
-        )
+
+    # Localizaciones: se muestran desde la cache en disco y se revalidan en segundo plano.
+    locale_summaries, locales_stale = get_cached_platform_locale_summary(limit=6)
+    locale_texts_column = ft.Column(spacing=4)
+    localization_section = ft.Container(
+        bgcolor=CARD_BG,
+        border_radius=12,
+        padding=12,
+        visible=False,
+        content=ft.Column(
+            [
+                ft.Text(
+                    "Localizaciones disponibles (Platform)",
+                    size=14,
+                    weight=ft.FontWeight.W_600,
+                    color=TEXT_PRIMARY,
+                ),
+                locale_texts_column,
+            ],
+            spacing=8,
+        ),
+    )
+
+    def render_locales(summaries: list[str], error: Optional[Exception]):
+        if not summaries and locale_texts_column.controls and error is not None:
+            # Una revalidacion fallida no borra lo que ya se esta mostrando.
+            return
+        locale_texts_column.controls.clear()
+        if summaries:
+            for item in summaries:
+                locale_texts_column.controls.append(ft.Text(item, size=12, color=TEXT_PRIMARY))
+        elif isinstance(error, PlatformLocationConfigError):
+            locale_texts_column.controls.append(
+                ft.Text(
+                    "Configura FATSECRET_PLATFORM_CLIENT_ID y FATSECRET_PLATFORM_CLIENT_SECRET para ver localizaciones.",
+                    size=12,
+                    color=TEXT_MUTED,
+                )
+            )
+        elif error is not None:
+            locale_texts_column.controls.append(ft.Text(str(error), size=12, color=TEXT_MUTED))
+        localization_section.visible = bool(locale_texts_column.controls)
+        if localization_section.page:
+            localization_section.update()
+
+    render_locales(locale_summaries, None)
+    if locales_stale:
+        revalidate_platform_locales(render_locales, limit=6)
 
     meal_order = {key: idx for idx, (key, _) in enumerate(MEAL_OPTIONS)}
     default_meal = MEAL_OPTIONS[1][0] if len(MEAL_OPTIONS) > 1 else MEAL_OPTIONS[0][0]
@@ -216,9 +242,12 @@ def MacrosView():
                 )
             )
         else:
-            for food in foods:
-                grams = float(food.get("portion", {}).get("grams") or 100)
-                macros_preview = format_macros(scale_macros(food, grams))
+            previews = scale_macros_each(
+                foods,
+                [float(food.get("portion", {}).get("grams") or 100) for food in foods],
+            )
+            for food, scaled in zip(foods, previews):
+                macros_preview = format_macros(scaled)
                 custom_library_column.controls.append(
                     ft.Container(
                         padding=12,
@@ -420,6 +449,11 @@ def MacrosView():
             value=f"{float((food_snapshot or {}).get('macros', {}).get('g', 0)):.1f}",
             keyboard_type=ft.KeyboardType.NUMBER,
         )
+        barcode_field = ft.TextField(
+            label="Codigo de barras (opcional)",
+            value=(food_snapshot or {}).get("barcode", ""),
+            keyboard_type=ft.KeyboardType.NUMBER,
+        )
         error_field = ft.Text("", color=ALERT_RED, size=12)
 
         def parse_value(field: ft.TextField, default=None):
@@ -438,6 +472,8 @@ def MacrosView():
             p_val = parse_value(p_field, default=None)
             c_val = parse_value(c_field, default=None)
             g_val = parse_value(g_field, default=None)
+            barcode_raw = (barcode_field.value or "").strip()
+            barcode_val = normalise_barcode(barcode_raw) if barcode_raw else ""
 
             if not name_value:
                 error_field.value = "Ingresa el nombre de la comida."
@@ -445,6 +481,8 @@ def MacrosView():
                 error_field.value = "Ingresa una porcion base valida."
             elif None in (kcal_val, p_val, c_val, g_val):
                 error_field.value = "Revisa los valores nutricionales."
+            elif barcode_val is None:
+                error_field.value = "El codigo de barras no es un EAN-13 valido."
             else:
                 description_val = (portion_desc_field.value or "").strip() or None
                 if editing_custom:
@@ -457,6 +495,7 @@ def MacrosView():
                         c=c_val,
                         g=g_val,
                         description=description_val,
+                        barcode=barcode_val,
                     )
                     if not updated:
                         error_field.value = "No se pudo actualizar la comida definida."
@@ -474,6 +513,7 @@ def MacrosView():
                         c=c_val or 0.0,
                         g=g_val or 0.0,
                         description=description_val,
+                        barcode=barcode_val or None,
                     )
                     target_id = created["id"]
                     message = "Comida definida creada"
@@ -508,6 +548,7 @@ def MacrosView():
                         p_field,
                         c_field,
                         g_field,
+                        barcode_field,
                         error_field,
                     ],
                     spacing=10,
@@ -595,8 +636,8 @@ def MacrosView():
         catalog_search_field = ft.TextField(
             label="Buscar alimento",
             suffix_icon=ICONS.SEARCH,
-            on_change=lambda ev: update_catalog_results(ev.control.value),
-            on_submit=lambda ev: update_catalog_results(ev.control.value),
+            on_change=lambda ev: schedule_catalog_search(ev.control.value),
+            on_submit=lambda ev: submit_catalog_search(ev.control.value),
         )
         catalog_serving_dropdown = ft.Dropdown(
             label="Tamano de porcion",
@@ -635,7 +676,8 @@ def MacrosView():
             bgcolor=CARD_BG,
             visible=False,
         )
-        selected_catalog = {"food": None, "serving": None, "serving_id": None, "override_grams": None}
+        # "picked" guarda el alimento tal como lo devolvio la busqueda, antes de aplicar una porcion.
+        selected_catalog = {"food": None, "picked": None, "serving": None, "serving_id": None, "override_grams": None}
 
         manual_name_field = ft.TextField(
             label="Nombre del alimento",
@@ -730,7 +772,7 @@ def MacrosView():
             if catalog_mode_group.page:
                 catalog_mode_group.update()
             if refresh:
-                update_catalog_results(current_search_query["value"])
+                schedule_catalog_search(current_search_query["value"], immediate=True)
 
         catalog_mode_group = ft.RadioGroup(
             value=catalog_mode["value"],
@@ -885,6 +927,7 @@ def MacrosView():
 
         def clear_catalog_selection():
             selected_catalog["food"] = None
+            selected_catalog["picked"] = None
             selected_catalog["serving"] = None
             selected_catalog["serving_id"] = None
             selected_catalog["override_grams"] = None
@@ -937,12 +980,12 @@ def MacrosView():
                     return "argentina" in tags
                 return (food.get("source") or "").lower() == "local"
 
-            recent_filtered: list[dict] = []
-            for item in recent_searches[:3]:
-                if mode == "argentina" and is_argentina_item(item):
-                    recent_filtered.append(item)
-                elif mode == "international" and not is_argentina_item(item):
-                    recent_filtered.append(item)
+            def matches_mode(item: dict) -> bool:
+                if mode == "argentina":
+                    return is_argentina_item(item)
+                return mode == "international" and not is_argentina_item(item)
+
+            recent_filtered = [item for item in get_recent_foods(RECENT_FOODS_LIMIT) if matches_mode(item)][:3]
 
             if recent_filtered:
                 catalog_results_column.controls.append(
@@ -950,8 +993,25 @@ def MacrosView():
                 )
                 for food in recent_filtered:
                     catalog_results_column.controls.append(make_tile(food, ICONS.HISTORY))
-                if foods:
-                    catalog_results_column.controls.append(ft.Divider(color="#30384C"))
+
+            # Sin texto de busqueda tambien sugerimos los alimentos mas usados.
+            shown_keys = {(item.get("id"), item.get("name")) for item in recent_filtered}
+            frequent_filtered: list[dict] = []
+            if not query:
+                for item in get_frequent_foods(RECENT_FOODS_LIMIT):
+                    if matches_mode(item) and (item.get("id"), item.get("name")) not in shown_keys:
+                        frequent_filtered.append(item)
+                frequent_filtered = frequent_filtered[:3]
+            if frequent_filtered:
+                catalog_results_column.controls.append(
+                    ft.Text("Usados frecuentemente", size=12, color=TEXT_MUTED)
+                )
+                for food in frequent_filtered:
+                    catalog_results_column.controls.append(make_tile(food, ICONS.STAR))
+            recent_filtered = recent_filtered + frequent_filtered
+
+            if recent_filtered and foods:
+                catalog_results_column.controls.append(ft.Divider(color="#30384C"))
 
             recent_keys = {(item.get("id"), item.get("name")) for item in recent_filtered}
             filtered_foods: list[dict] = []
@@ -975,25 +1035,79 @@ def MacrosView():
             if catalog_results_column.page:
                 catalog_results_column.update()
 
-        def update_catalog_results(query: str):
-            current_search_query["value"] = (query or "").strip()
-            mode = catalog_mode["value"]
+        search_state = {"generation": 0, "task": None, "cancelled": threading.Event()}
+
+        def supersede_catalog_search() -> int:
+            # La busqueda anterior se descarta: su tarea se cancela y la version sincronica
+            # deja de lanzar consultas remotas.
+            search_state["generation"] += 1
+            search_state["cancelled"].set()
+            search_state["cancelled"] = threading.Event()
+            previous = search_state["task"]
+            if previous is not None:
+                previous.cancel()
+                search_state["task"] = None
+            return search_state["generation"]
+
+        def show_catalog_results(generation: int, foods, query: str):
+            # Respuestas de busquedas reemplazadas se descartan.
+            if generation != search_state["generation"]:
+                return
+            last_catalog_results["foods"] = foods
+            set_catalog_results(foods, query)
+
+        def fetch_catalog_results(generation: int, query: str, mode: str, cancelled: threading.Event):
             if mode == "argentina":
-                foods = search_local_foods(current_search_query["value"], limit=20, tags=("argentina",))
+                return search_local_foods(query, limit=20, tags=("argentina",))
+            # Los alimentos argentinos quedan al final; solo completan la lista si no hay otros.
+            return search_foods_fanout(
+                query,
+                limit=12,
+                demote_tags=("argentina",),
+                on_update=lambda partial: show_catalog_results(generation, partial, query),
+                cancelled=cancelled,
+            )
+
+        async def run_catalog_search(generation: int, query: str, mode: str, delay: float):
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if generation != search_state["generation"]:
+                return
+            if mode == "argentina":
+                foods = await asyncio.to_thread(search_local_foods, query, limit=20, tags=("argentina",))
             else:
-                foods = search_foods(current_search_query["value"], limit=12)
-                has_non_local = any((item.get("source") or "").lower() != "local" for item in foods)
-                if has_non_local:
-                    filtered = []
-                    for item in foods:
-                        tags = {str(tag).lower() for tag in item.get("tags", []) or []}
-                        if "argentina" in tags and (item.get("source") or "").lower() == "local":
-                            continue
-                        filtered.append(item)
-                    if filtered:
-                        foods = filtered
-            last_catalog_results["foods"] = foods
-            set_catalog_results(foods, current_search_query["value"])
+                # Las consultas remotas corren en el event loop de la app; cancelar la tarea las corta.
+                foods = await search_foods_fanout_async(
+                    query,
+                    limit=12,
+                    demote_tags=("argentina",),
+                    on_update=lambda partial: show_catalog_results(generation, partial, query),
+                )
+            show_catalog_results(generation, foods, query)
+
+        def submit_catalog_search(query: str):
+            # Los lectores de codigo de barras tipean el EAN y envian Enter: se resuelve sin buscar texto.
+            food = lookup_barcode(query)
+            if not food:
+                schedule_catalog_search(query, immediate=True)
+                return
+            current_search_query["value"] = (query or "").strip()
+            generation = supersede_catalog_search()
+            show_catalog_results(generation, [food], current_search_query["value"])
+            select_catalog_food(food)
+
+        def schedule_catalog_search(query: str, *, immediate: bool = False):
+            current_search_query["value"] = (query or "").strip()
+            generation = supersede_catalog_search()
+            mode = catalog_mode["value"]
+
+            query = current_search_query["value"]
+            if not hasattr(page, "run_task"):
+                cancelled = search_state["cancelled"]
+                show_catalog_results(generation, fetch_catalog_results(generation, query, mode, cancelled), query)
+                return
+            delay = 0.0 if immediate else SEARCH_DEBOUNCE_SECONDS
+            search_state["task"] = page.run_task(run_catalog_search, generation, query, mode, delay)
 
         def apply_serving_selection(food: dict, serving_id: str | None):
             servings = food.get("servings") or []
@@ -1077,12 +1191,14 @@ def MacrosView():
             if not food:
                 return
             apply_serving_selection(food, serving_id)
-            record_recent_search(food)
             if last_catalog_results["foods"]:
                 set_catalog_results(last_catalog_results["foods"], current_search_query["value"])
 
         def select_catalog_food(food: dict):
+            # Las porciones de FatSecret se procesan recien al abrir el alimento.
+            expand_servings(food)
             selected_catalog["food"] = food
+            selected_catalog["picked"] = deepcopy(food)
             selected_catalog["serving"] = None
             selected_catalog["serving_id"] = None
             selected_catalog["override_grams"] = None
@@ -1209,18 +1325,7 @@ def MacrosView():
             override = selected_catalog.get("override_grams")
             if override and override > 0:
                 snapshot["preferred_grams"] = float(override)
-            identifier = snapshot.get("id") or snapshot.get("name")
-            filtered = []
-            for item in recent_searches:
-                item_id = item.get("id") or item.get("name")
-                if item_id == identifier:
-                    continue
-                filtered.append(item)
-            recent_searches.clear()
-            recent_searches.extend(filtered)
-            recent_searches.insert(0, snapshot)
-            if len(recent_searches) > 3:
-                del recent_searches[3:]
+            record_recent_food(snapshot)
 
         def refresh_custom_foods(select_id: str | None = None):
             foods = list_custom_foods()
@@ -1258,6 +1363,8 @@ def MacrosView():
                 elif grams is None or grams <= 0:
                     error_text.value = "Ingresa una cantidad valida en gramos."
                 else:
+                    # Guarda la porcion y los gramos elegidos antes de registrar la comida.
+                    record_recent_search(food)
                     macros = scale_macros(food, grams)
                     food_ref = {
                         "id": food["id"],
@@ -1289,6 +1396,8 @@ def MacrosView():
                             macros["g"],
                             food_ref=food_ref,
                         )
+                    # Los alimentos remotos registrados quedan disponibles offline en el catalogo aprendido.
+                    promote_food(selected_catalog.get("picked") or food)
             elif selected_tab == 1:
                 name = (manual_name_field.value or "").strip()
                 grams = parse_float_field(manual_grams_field, default=None)
@@ -1547,8 +1656,7 @@ def MacrosView():
         )
 
         clear_catalog_selection()
-        current_search_query["value"] = ""
-        update_catalog_results("")
+        schedule_catalog_search("", immediate=True)
 
         page.open(dialog)
         refresh_custom_foods(current_custom_id)
@@ -1844,7 +1952,7 @@ def MacrosView():
             totals_info_text,
             ft.Text("Resumen diario", size=15, weight=ft.FontWeight.W_600, color=TEXT_PRIMARY),
             macro_summary_column,
-            *([localization_section] if localization_section else []),
+            localization_section,
             ft.Text("Comidas recientes", size=15, weight=ft.FontWeight.W_600, color=TEXT_PRIMARY),
             quick_section_column,
             ft.Row(
@@ -0,0 +1,270 @@
+import asyncio
+import gzip
+import time
+import urllib.parse
+from typing import Dict, List, Optional, Tuple
+
+from services.http_transport import DEFAULT_TIMEOUT, HttpResponse, HttpStatusError, HttpTransportError, ssl_context
+
+
+_HostKey = Tuple[str, str, int]
+_Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class AsyncHttpTransport:
+    """
+    Minimal HTTP/1.1 client on asyncio streams with keep-alive connections per host.
+    One instance belongs to one event loop; ``max_per_host`` bounds concurrent
+    connections so a burst of searches cannot open unbounded sockets.
+    """
+
+    def __init__(self, *, max_per_host: int = 10, idle_timeout: float = 60.0):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self._idle: Dict[_HostKey, List[Tuple[_Connection, float]]] = {}
+        self._limits: Dict[_HostKey, asyncio.Semaphore] = {}
+        self.requests = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        headers: Optional[Dict[str, str]] = None,
+        body: Optional[bytes] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> HttpResponse:
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme or "https"
+        host = parts.hostname or ""
+        port = parts.port or (443 if scheme == "https" else 80)
+        host_key: _HostKey = (scheme, host, port)
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+
+        request_headers = {
+            "Host": host if parts.port is None else f"{host}:{port}",
+            "Accept-Encoding": "gzip",
+            "Connection": "keep-alive",
+            "Content-Length": str(len(body or b"")),
+        }
+        request_headers.update(headers or {})
+        raw_request = f"{method} {path} HTTP/1.1\r\n".encode("latin-1")
+        raw_request += "".join(f"{k}: {v}\r\n" for k, v in request_headers.items()).encode("latin-1")
+        raw_request += b"\r\n" + (body or b"")
+
+        self.requests += 1
+        limit = self._limits.setdefault(host_key, asyncio.Semaphore(self.max_per_host))
+        async with limit:
+            try:
+                status, response_headers, payload = await asyncio.wait_for(
+                    self._exchange(host_key, raw_request, timeout),
+                    timeout=timeout,
+                )
+            except asyncio.TimeoutError as exc:
+                raise HttpTransportError("timed out") from exc
+            except (OSError, asyncio.IncompleteReadError, ValueError) as exc:
+                raise HttpTransportError(str(exc)) from exc
+
+        if status >= 400:
+            raise HttpStatusError(status, payload)
+        return HttpResponse(status, response_headers, payload)
+
+    async def _exchange(self, host_key: _HostKey, raw_request: bytes, timeout: float) -> Tuple[int, Dict[str, str], bytes]:
+        conn, reused = await self._checkout(host_key, timeout)
+        try:
+            result = await self._roundtrip(conn, raw_request)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            _close(conn)
+            if not reused:
+                raise
+            # Pooled connection was closed by the server; retry once on a new one.
+            conn, _ = await self._checkout(host_key, timeout, fresh=True)
+            try:
+                result = await self._roundtrip(conn, raw_request)
+            except BaseException:
+                _close(conn)
+                raise
+        except BaseException:
+            _close(conn)
+            raise
+
+        status, headers, payload, keep_alive = result
+        if keep_alive:
+            self._idle.setdefault(host_key, []).append((conn, time.monotonic()))
+        else:
+            _close(conn)
+        return status, headers, payload
+
+    async def _roundtrip(self, conn: _Connection, raw_request: bytes) -> Tuple[int, Dict[str, str], bytes, bool]:
+        reader, writer = conn
+        writer.write(raw_request)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed before response.")
+        version, status_text = status_line.decode("latin-1").split(" ", 2)[:2]
+        status = int(status_text)
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get("connection", "").lower()
+        closing = connection == "close" or (version == "HTTP/1.0" and connection != "keep-alive")
+
+        if raw_request.startswith(b"HEAD ") or status in (204, 304) or 100 <= status < 200:
+            # These responses never carry a body, whatever their headers say.
+            payload = b""
+            keep_alive = True
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size_line = await reader.readline()
+                size = int(size_line.split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    # Optional trailer fields end with a blank line; consume them all so no
+                    # bytes are left on a connection that goes back to the pool.
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            payload = b"".join(chunks)
+            keep_alive = True
+        elif "content-length" in headers:
+            payload = await reader.readexactly(int(headers["content-length"]))
+            keep_alive = True
+        elif closing:
+            # Delimited by the server closing the connection.
+            payload = await reader.read()
+            keep_alive = False
+        else:
+            # No length on a connection the server keeps open: reading to EOF would hang
+            # until the idle timeout, so the body is taken as empty and the socket dropped.
+            payload = b""
+            keep_alive = False
+
+        if closing:
+            keep_alive = False
+        if payload and headers.get("content-encoding", "").lower() == "gzip":
+            payload = gzip.decompress(payload)
+        return status, headers, payload, keep_alive
+
+    async def _checkout(self, host_key: _HostKey, timeout: float, *, fresh: bool = False) -> Tuple[_Connection, bool]:
+        if not fresh:
+            now = time.monotonic()
+            idle = self._idle.get(host_key) or []
+            while idle:
+                conn, last_used = idle.pop()
+                if now - last_used < self.idle_timeout and not conn[0].at_eof():
+                    self.connections_reused += 1
+                    return conn, True
+                _close(conn)
+
+        scheme, host, port = host_key
+        conn = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl_context() if scheme == "https" else None),
+            timeout=timeout,
+        )
+        self.connections_opened += 1
+        return conn, False
+
+    async def close(self) -> None:
+        pools = list(self._idle.values())
+        self._idle.clear()
+        for idle in pools:
+            for conn, _ in idle:
+                _close(conn)
+                try:
+                    await conn[1].wait_closed()
+                except (OSError, ConnectionError):
+                    pass
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connections_reused": self.connections_reused,
+            "reuse_rate": (self.connections_reused / self.requests) if self.requests else 0.0,
+            "idle_connections": sum(len(pool) for pool in self._idle.values()),
+        }
+
+
+def _close(conn: _Connection) -> None:
+    try:
+        conn[1].close()
+    except (OSError, RuntimeError):
+        pass
+
+
+_transports: Dict[int, Tuple[asyncio.AbstractEventLoop, AsyncHttpTransport]] = {}
+
+
+def get_async_transport() -> AsyncHttpTransport:
+    """
+    Transport shared by every coroutine on the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    entry = _transports.get(id(loop))
+    if entry is None or entry[0] is not loop:
+        for key, (other_loop, _) in list(_transports.items()):
+            if other_loop.is_closed():
+                del _transports[key]
+        entry = (loop, AsyncHttpTransport())
+        _transports[id(loop)] = entry
+    return entry[1]
+
+
+async def _load_test(total: int = 200, latency: float = 0.05) -> None:
+    """
+    Serves a local mock API with fixed latency and measures throughput at growing concurrency.
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                while (await reader.readline()) not in (b"\r\n", b""):
+                    pass
+                await asyncio.sleep(latency)
+                body = b'{"ok": true}'
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/rest/server.api"
+
+    for concurrency in (1, 5, 10, 25, 50):
+        transport = AsyncHttpTransport(max_per_host=concurrency)
+        started = time.perf_counter()
+        await asyncio.gather(*(transport.request("GET", url) for _ in range(total)))
+        elapsed = time.perf_counter() - started
+        stats = transport.stats()
+        print(
+            f"concurrency={concurrency:>3}  {total / elapsed:8.1f} req/s  "
+            f"conexiones={stats['connections_opened']}  reutilizadas={stats['connections_reused']}"
+        )
+        await transport.close()
+        # Let the mock handlers see EOF before the next round.
+        await asyncio.sleep(0.05)
+
+    server.close()
+    await server.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(_load_test())
@@ -0,0 +1,190 @@
+import csv
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from services.file_lock import FileLock, lock_path_for
+
+
+DEFAULT_BARCODES_PATH = Path(__file__).resolve().parent.parent / "data" / "barcodes.json"
+# Accepted column names in bulk CSV files; the first one present wins.
+CSV_BARCODE_COLUMNS = ("barcode", "ean", "ean13", "codigo")
+CSV_FOOD_COLUMNS = ("food_id", "id", "alimento")
+
+
+def ean13_check_digit(digits: str) -> int:
+    """
+    Check digit for the first 12 digits of an EAN-13 code.
+    """
+    total = sum(int(digit) * (3 if idx % 2 else 1) for idx, digit in enumerate(digits[:12]))
+    return (10 - total % 10) % 10
+
+
+def normalise_barcode(code) -> Optional[str]:
+    """
+    Canonical EAN-13 form of ``code``, or None when it is not a valid barcode.
+    Spaces and dashes are ignored, 12-digit UPC-A codes get their leading zero and
+    GTIN-14 codes padded with a leading zero (as in USDA data) lose it.
+    """
+    digits = "".join(str(code or "").split()).replace("-", "")
+    if len(digits) == 14 and digits.startswith("0"):
+        digits = digits[1:]
+    if len(digits) == 12:
+        digits = "0" + digits
+    if len(digits) != 13 or not digits.isdigit():
+        return None
+    if ean13_check_digit(digits) != int(digits[12]):
+        return None
+    return digits
+
+
+class BarcodeStore:
+    """
+    Barcode -> food id assignments loaded in bulk (see :meth:`load_csv`), for products
+    whose food entry does not carry a ``barcode`` field. Persisted as JSON; the file is
+    the source of truth, so the CLI and the running app can both write it: saves merge
+    into the current file under a cross-process lock, and reads reload it when its
+    mtime changes.
+    """
+
+    def __init__(self, path: Path = DEFAULT_BARCODES_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(lock_path_for(self.path))
+        self._codes: Dict[str, str] = {}
+        self._mtime: Optional[int] = None
+        # Counts this process's changes, which stay in memory if the file cannot be written.
+        self._changes = 0
+        with self._lock:
+            self._refresh_locked()
+
+    @property
+    def version(self) -> Tuple[Optional[int], int]:
+        """
+        Changes whenever any process saves new assignments, so callers can tell when to
+        rebuild their indexes.
+        """
+        with self._lock:
+            self._refresh_locked()
+            return self._mtime, self._changes
+
+    def _file_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _read_file(self) -> Dict[str, str]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        codes: Dict[str, str] = {}
+        for code, food_id in (data.get("barcodes") or {}).items():
+            code = normalise_barcode(code)
+            if code and food_id:
+                codes[code] = str(food_id)
+        return codes
+
+    def _refresh_locked(self) -> None:
+        mtime = self._file_mtime()
+        if mtime is not None and mtime != self._mtime:
+            self._codes = self._read_file()
+            self._mtime = mtime
+
+    def get(self, code: str) -> Optional[str]:
+        with self._lock:
+            self._refresh_locked()
+            return self._codes.get(code)
+
+    def items(self) -> Dict[str, str]:
+        with self._lock:
+            self._refresh_locked()
+            return dict(self._codes)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh_locked()
+            return len(self._codes)
+
+    def assign(self, code, food_id: str) -> bool:
+        """
+        Links ``code`` to ``food_id``; returns False for invalid barcodes.
+        """
+        return self.assign_many([(code, food_id)])[0] == 1
+
+    def assign_many(self, pairs) -> Tuple[int, int]:
+        """
+        Links every ``(code, food_id)`` pair and saves once; returns (stored, rejected).
+        """
+        assignments: Dict[str, str] = {}
+        stored = rejected = 0
+        for code, food_id in pairs:
+            code = normalise_barcode(code)
+            food_id = str(food_id or "").strip()
+            if not code or not food_id:
+                rejected += 1
+                continue
+            assignments[code] = food_id
+            stored += 1
+        if assignments:
+            with self._lock, self._file_lock.locked():
+                # Re-read under the file lock so assignments saved by another process survive.
+                self._refresh_locked()
+                self._codes.update(assignments)
+                self._changes += 1
+                self._save_locked()
+        return stored, rejected
+
+    def load_csv(self, path: Path) -> Tuple[int, int]:
+        """
+        Ingests a CSV with a barcode column (barcode/ean/ean13/codigo) and a food id
+        column (food_id/id/alimento); returns (stored, rejected) row counts.
+        """
+        with open(path, "r", encoding="utf-8-sig", newline="") as fh:
+            reader = csv.DictReader(fh)
+            fields = {name.strip().lower(): name for name in reader.fieldnames or []}
+            code_column = next((fields[name] for name in CSV_BARCODE_COLUMNS if name in fields), None)
+            food_column = next((fields[name] for name in CSV_FOOD_COLUMNS if name in fields), None)
+            if not code_column or not food_column:
+                raise ValueError("El CSV necesita columnas de codigo de barras y de id de alimento.")
+            return self.assign_many((row.get(code_column), row.get(food_column)) for row in reader)
+
+    def _save_locked(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp_path.write_text(json.dumps({"barcodes": self._codes}, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+        except OSError:
+            return
+        self._mtime = self._file_mtime()
+
+
+_store: Optional[BarcodeStore] = None
+_store_lock = threading.Lock()
+
+
+def get_barcode_store() -> BarcodeStore:
+    """
+    Shared store; MACROENTRENO_BARCODES_PATH moves the file.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            path = os.getenv("MACROENTRENO_BARCODES_PATH")
+            _store = BarcodeStore(Path(path) if path else DEFAULT_BARCODES_PATH)
+        return _store
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python -m services.barcodes <codigos.csv> [...]")
+        sys.exit(1)
+    store = get_barcode_store()
+    for arg in sys.argv[1:]:
+        stored, rejected = store.load_csv(Path(arg))
+        print(f"{arg}: {stored} codigos cargados, {rejected} rechazados")
@@ -0,0 +1,97 @@
+import hashlib
+import importlib.util
+import json
+import os
+import pickle
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from services.catalog_index import CatalogIndex
+
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+FOODS_PATH = DATA_DIR / "foods.json"
+META_PATH = DATA_DIR / "argentina_meta.py"
+COMPILED_PATH = DATA_DIR / "foods.catalog"
+# The pickled index's layout is defined here, so editing it must invalidate the compiled file.
+INDEX_SOURCE_PATH = Path(__file__).resolve().parent / "catalog_index.py"
+
+_MAGIC = b"MECAT1\n"
+_DIGEST_SIZE = 64  # sha256 hex
+
+
+def source_digest() -> str:
+    digest = hashlib.sha256()
+    for path in (FOODS_PATH, META_PATH, INDEX_SOURCE_PATH):
+        digest.update(path.name.encode("utf-8"))
+        if path.exists():
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def _load_sources() -> CatalogIndex:
+    items: List[Dict] = []
+    if FOODS_PATH.exists():
+        with FOODS_PATH.open("r", encoding="utf-8") as fh:
+            items = json.load(fh)
+
+    meta: Dict[str, Dict] = {}
+    if META_PATH.exists():
+        spec = importlib.util.spec_from_file_location("_argentina_meta_source", META_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        meta = getattr(module, "ARGENTINA_PRODUCTS_META", {}) or {}
+
+    return CatalogIndex(items, meta)
+
+
+def compile_catalog(path: Path = COMPILED_PATH) -> CatalogIndex:
+    """
+    Builds the index from the sources and writes it to ``path``.
+    Write failures (read-only installs) are ignored; the index is still returned.
+    """
+    digest = source_digest()
+    index = _load_sources()
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    try:
+        with tmp_path.open("wb") as fh:
+            fh.write(_MAGIC)
+            fh.write(digest.encode("ascii"))
+            pickle.dump(index, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+    return index
+
+
+def _read_compiled(path: Path, digest: str) -> Optional[CatalogIndex]:
+    try:
+        with path.open("rb") as fh:
+            if fh.read(len(_MAGIC)) != _MAGIC:
+                return None
+            if fh.read(_DIGEST_SIZE).decode("ascii", errors="ignore") != digest:
+                return None
+            index = pickle.load(fh)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    return index if isinstance(index, CatalogIndex) else None
+
+
+def load_catalog(path: Path = COMPILED_PATH) -> CatalogIndex:
+    """
+    Returns the compiled catalogue (foods.json + Argentina metadata + indexes),
+    rebuilding it when the sources changed. ``python -m services.catalog_build``
+    builds it ahead of time.
+    """
+    index = _read_compiled(path, source_digest())
+    if index is None:
+        index = compile_catalog(path)
+    return index
+
+
+if __name__ == "__main__":
+    built = compile_catalog()
+    print(f"{len(built)} alimentos compilados en {COMPILED_PATH}")
@@ -0,0 +1,107 @@
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional
+
+
+# Name n-grams up to this length are indexed; longer queries intersect their trigrams.
+_MAX_GRAM = 3
+
+
+def _grams(text: str, size: int) -> Iterator[str]:
+    for start in range(len(text) - size + 1):
+        yield text[start:start + size]
+
+
+def iter_positions(bits: int) -> Iterator[int]:
+    """
+    Yields the catalog positions set in an int bitset, lowest first.
+    """
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class CatalogIndex:
+    """
+    Bitmap index over the positions of the local catalogue.
+    Every tag, category and name n-gram maps to a Python int whose bit ``i`` is set
+    when catalogue item ``i`` carries it, so filters become bitwise ANDs/ORs.
+    """
+
+    def __init__(self, items: List[Dict], meta: Optional[Mapping[str, Dict]] = None):
+        meta = meta or {}
+        self.items = items
+        self.meta: Dict[str, Dict] = {item.get("id"): meta[item.get("id")] for item in items if item.get("id") in meta}
+        self.names: List[str] = []
+        self.all_bits = (1 << len(items)) - 1
+        self.tag_bits: Dict[str, int] = {}
+        self.category_bits: Dict[str, int] = {}
+        self.gram_bits: Dict[str, int] = {}
+        self._category_labels: Dict[str, str] = {}
+
+        for pos, item in enumerate(items):
+            bit = 1 << pos
+            name = (item.get("name") or "").lower()
+            self.names.append(name)
+
+            item_meta = meta.get(item.get("id") or "") or {}
+            for tag in item_meta.get("tags") or []:
+                key = str(tag).lower()
+                self.tag_bits[key] = self.tag_bits.get(key, 0) | bit
+            category = item_meta.get("category")
+            if category:
+                key = str(category).lower()
+                self.category_bits[key] = self.category_bits.get(key, 0) | bit
+                self._category_labels.setdefault(key, str(category))
+
+            for size in range(1, _MAX_GRAM + 1):
+                for gram in set(_grams(name, size)):
+                    self.gram_bits[gram] = self.gram_bits.get(gram, 0) | bit
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def tags_bits(self, tags: Iterable[str], *, match_all: bool = False) -> int:
+        """
+        Positions carrying any (or, with ``match_all``, every) of the given tags.
+        """
+        keys = [str(tag).lower() for tag in tags]
+        if not keys:
+            return self.all_bits
+        if match_all:
+            bits = self.all_bits
+            for key in keys:
+                bits &= self.tag_bits.get(key, 0)
+                if not bits:
+                    break
+            return bits
+        bits = 0
+        for key in keys:
+            bits |= self.tag_bits.get(key, 0)
+        return bits
+
+    def categories_bits(self, categories: Iterable[str]) -> int:
+        bits = 0
+        for category in categories:
+            bits |= self.category_bits.get(str(category).lower(), 0)
+        return bits
+
+    def text_bits(self, query_l: str) -> int:
+        """
+        Superset of the positions whose name contains ``query_l``.
+        Candidates still need a substring check, but non-matching items are never visited.
+        """
+        if not query_l:
+            return self.all_bits
+        size = min(len(query_l), _MAX_GRAM)
+        bits = self.all_bits
+        for gram in set(_grams(query_l, size)):
+            bits &= self.gram_bits.get(gram, 0)
+            if not bits:
+                break
+        return bits
+
+    def categories(self) -> List[str]:
+        return sorted(self._category_labels.values())
+
+    def tags(self) -> List[str]:
+        return sorted(self.tag_bits)
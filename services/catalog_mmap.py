@@ -0,0 +1,363 @@
+import bisect
+import heapq
+import itertools
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from services.barcodes import normalise_barcode
+
+
+# File layout (little endian):
+#   header    magic + counts/offsets (_HEADER)
+#   records   one fixed-width row per food (_RECORD): kcal, p, c, g, portion grams
+#             followed by string-heap offsets for id, name, portion description,
+#             brand, category, tags (comma separated), source and barcode
+#   names     uint32 start offset of every record inside the search heap
+#   search    lowercase names joined by "\n", scanned in place with mmap.find
+#   heap      uint16 length-prefixed UTF-8 strings (offset 0 is the empty string)
+#   barcodes  (EAN-13 as uint64, record position) pairs sorted by code, binary searched
+# MEMAP01 files (no barcode field or table) are still read.
+_MAGIC = b"MEMAP02\n"
+_HEADER = struct.Struct("<8sQQQQQQQQ")
+_RECORD = struct.Struct("<5d8I")
+_MAGIC_V1 = b"MEMAP01\n"
+_HEADER_V1 = struct.Struct("<8sQQQQQQ")
+_RECORD_V1 = struct.Struct("<5d7I")
+_OFFSET = struct.Struct("<I")
+_STRING_LEN = struct.Struct("<H")
+_BARCODE = struct.Struct("<QI")
+_STRING_FIELDS = ("id", "name", "description", "brand", "category", "tags", "source", "barcode")
+_NAME_SEPARATOR = b"\n"
+_DEDUPE_LIMIT = 65536
+
+
+class MappedCatalogError(Exception):
+    """Raised when a mapped catalogue file is missing or malformed."""
+
+
+class CatalogWriter:
+    """
+    Streams foods into the mapped catalogue format with bounded memory.
+    Rows, names and strings are spooled to temporary files and stitched together on close.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.count = 0
+        self._tmp_dir = tempfile.mkdtemp(prefix="macroentreno-catalog-")
+        self._records = open(os.path.join(self._tmp_dir, "records"), "wb")
+        self._names = open(os.path.join(self._tmp_dir, "names"), "wb")
+        self._search = open(os.path.join(self._tmp_dir, "search"), "wb")
+        self._heap = open(os.path.join(self._tmp_dir, "heap"), "wb")
+        self._search_size = 0
+        self._heap_size = 0
+        self._dedupe: Dict[str, int] = {}
+        # 12 bytes per coded food; sorted into the barcode table on close.
+        self._barcode_codes = array("Q")
+        self._barcode_positions = array("I")
+        self._write_string("")
+
+    def __enter__(self) -> "CatalogWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _write_string(self, value: str) -> int:
+        cached = self._dedupe.get(value)
+        if cached is not None:
+            return cached
+        encoded = value.encode("utf-8")[:0xFFFF]
+        offset = self._heap_size
+        self._heap.write(_STRING_LEN.pack(len(encoded)))
+        self._heap.write(encoded)
+        self._heap_size += _STRING_LEN.size + len(encoded)
+        if len(self._dedupe) < _DEDUPE_LIMIT and len(value) <= 64:
+            self._dedupe[value] = offset
+        return offset
+
+    def add(self, item: Dict) -> None:
+        portion = item.get("portion") or {}
+        macros = item.get("macros") or {}
+        tags = item.get("tags") or []
+        barcode = normalise_barcode(item.get("barcode")) if item.get("barcode") else None
+        strings = {
+            "id": str(item.get("id") or ""),
+            "name": str(item.get("name") or ""),
+            "description": str(portion.get("description") or ""),
+            "brand": str(item.get("brand") or ""),
+            "category": str(item.get("category") or ""),
+            "tags": ",".join(str(tag) for tag in tags),
+            "source": str(item.get("source") or ""),
+            "barcode": barcode or "",
+        }
+        if barcode:
+            self._barcode_codes.append(int(barcode))
+            self._barcode_positions.append(self.count)
+        self._records.write(
+            _RECORD.pack(
+                float(macros.get("kcal") or 0.0),
+                float(macros.get("p") or 0.0),
+                float(macros.get("c") or 0.0),
+                float(macros.get("g") or 0.0),
+                float(portion.get("grams") or 0.0),
+                *(self._write_string(strings[field]) for field in _STRING_FIELDS),
+            )
+        )
+
+        search_name = strings["name"].lower().replace("\n", " ").encode("utf-8")
+        self._names.write(_OFFSET.pack(self._search_size))
+        self._search.write(search_name + _NAME_SEPARATOR)
+        self._search_size += len(search_name) + len(_NAME_SEPARATOR)
+        self.count += 1
+
+    def close(self) -> None:
+        parts = [self._records, self._names, self._search, self._heap]
+        for part in parts:
+            part.close()
+
+        records_off = _HEADER.size
+        names_off = records_off + self.count * _RECORD.size
+        search_off = names_off + self.count * _OFFSET.size
+        heap_off = search_off + self._search_size
+        barcodes_off = heap_off + self._heap_size
+        codes, positions = self._barcode_codes, self._barcode_positions
+
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "wb") as out:
+            header = (self.count, records_off, names_off, search_off, heap_off, self._search_size, barcodes_off, len(codes))
+            out.write(_HEADER.pack(_MAGIC, *header))
+            for part in parts:
+                with open(part.name, "rb") as src:
+                    shutil.copyfileobj(src, out, 1024 * 1024)
+            # Stable sort: for a code shared by several rows the first written wins.
+            for idx in sorted(range(len(codes)), key=codes.__getitem__):
+                out.write(_BARCODE.pack(codes[idx], positions[idx]))
+        os.replace(tmp_path, self.path)
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+    def abort(self) -> None:
+        for part in (self._records, self._names, self._search, self._heap):
+            part.close()
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+
+def write_catalog(items: Iterable[Dict], path: Path) -> int:
+    with CatalogWriter(path) as writer:
+        for item in items:
+            writer.add(item)
+    return writer.count
+
+
+class MappedCatalog:
+    """
+    Read-only view over a mapped catalogue file.
+    Searches scan the lowercase name heap inside the mmap; only returned rows are turned into dicts.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        try:
+            self._fh = open(self.path, "rb")
+        except OSError as exc:
+            raise MappedCatalogError(str(exc)) from exc
+        try:
+            self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+            magic = self._mm[:len(_MAGIC)]
+            if magic == _MAGIC:
+                header = _HEADER.unpack_from(self._mm, 0)
+                _, count, records_off, names_off, search_off, heap_off, search_size, barcodes_off, barcodes_count = header
+                self._record_struct, self._fields = _RECORD, _STRING_FIELDS
+            elif magic == _MAGIC_V1:
+                _, count, records_off, names_off, search_off, heap_off, search_size = _HEADER_V1.unpack_from(self._mm, 0)
+                barcodes_off = barcodes_count = 0
+                self._record_struct, self._fields = _RECORD_V1, _STRING_FIELDS[:-1]
+        except (ValueError, struct.error) as exc:
+            self._fh.close()
+            raise MappedCatalogError(f"Invalid catalogue file: {self.path}") from exc
+        if magic not in (_MAGIC, _MAGIC_V1):
+            self.close()
+            raise MappedCatalogError(f"Invalid catalogue file: {self.path}")
+
+        self._count = count
+        self._barcodes_off = barcodes_off
+        self._barcodes_count = barcodes_count
+        self._records_off = records_off
+        self._search_off = search_off
+        self._search_end = search_off + search_size
+        self._heap_off = heap_off
+        names_view = memoryview(self._mm)[names_off:names_off + count * _OFFSET.size]
+        self._name_offsets = names_view.cast("I") if sys.byteorder == "little" else None
+        self._names_off = names_off
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        self._name_offsets = None
+        try:
+            self._mm.close()
+        except (AttributeError, BufferError):
+            pass
+        self._fh.close()
+
+    def _name_start(self, pos: int) -> int:
+        if self._name_offsets is not None:
+            return self._name_offsets[pos]
+        return _OFFSET.unpack_from(self._mm, self._names_off + pos * _OFFSET.size)[0]
+
+    def _position_for(self, search_offset: int) -> int:
+        if self._name_offsets is not None:
+            return bisect.bisect_right(self._name_offsets, search_offset) - 1
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name_start(mid) <= search_offset:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+    def _name_length(self, pos: int) -> int:
+        # In characters, like the scores of the in-memory indexes; only matched rows are decoded.
+        start = self._search_off + self._name_start(pos)
+        end = self._name_start(pos + 1) if pos + 1 < self._count else self._search_end - self._search_off
+        raw = self._mm[start:self._search_off + end - len(_NAME_SEPARATOR)]
+        return len(raw) if raw.isascii() else len(raw.decode("utf-8", "replace"))
+
+    def _string(self, offset: int) -> str:
+        start = self._heap_off + offset
+        (length,) = _STRING_LEN.unpack_from(self._mm, start)
+        start += _STRING_LEN.size
+        return self._mm[start:start + length].decode("utf-8")
+
+    def _row(self, pos: int) -> Tuple:
+        return self._record_struct.unpack_from(self._mm, self._records_off + pos * self._record_struct.size)
+
+    def tags(self, pos: int) -> List[str]:
+        raw = self._string(self._row(pos)[5 + _STRING_FIELDS.index("tags")])
+        return [tag for tag in raw.split(",") if tag]
+
+    def category(self, pos: int) -> str:
+        return self._string(self._row(pos)[5 + _STRING_FIELDS.index("category")])
+
+    def food_id(self, pos: int) -> str:
+        return self._string(self._row(pos)[5 + _STRING_FIELDS.index("id")])
+
+    def record(self, pos: int) -> Dict:
+        """
+        Materialises row ``pos`` into the catalogue item shape used by foods.json.
+        """
+        row = self._row(pos)
+        kcal, p, c, g, grams = row[:5]
+        strings = {field: self._string(offset) for field, offset in zip(self._fields, row[5:])}
+        item: Dict = {
+            "id": strings["id"],
+            "name": strings["name"],
+            "portion": {"grams": grams or 100.0, "description": strings["description"]},
+            "macros": {"kcal": kcal, "p": p, "c": c, "g": g},
+        }
+        for field in ("brand", "category", "source", "barcode"):
+            if strings.get(field):
+                item[field] = strings[field]
+        if strings["tags"]:
+            item["tags"] = strings["tags"].split(",")
+        return item
+
+    def find_barcode(self, code: str) -> Optional[int]:
+        """
+        Position of the row carrying the EAN-13 ``code`` (see services.barcodes), or None.
+        """
+        if not code or not code.isdigit():
+            return None
+        key = int(code)
+        lo, hi = 0, self._barcodes_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _BARCODE.unpack_from(self._mm, self._barcodes_off + mid * _BARCODE.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self._barcodes_count:
+            return None
+        value, pos = _BARCODE.unpack_from(self._mm, self._barcodes_off + lo * _BARCODE.size)
+        return pos if value == key else None
+
+    def find_positions(self, query_l: str) -> Iterable[Tuple[int, int]]:
+        """
+        Yields ``(position, name_length)`` for every row whose lowercase name contains ``query_l``;
+        lengths are in characters.
+        """
+        needle = query_l.encode("utf-8")
+        start = self._search_off
+        last_pos = -1
+        while True:
+            hit = self._mm.find(needle, start, self._search_end)
+            if hit < 0:
+                return
+            pos = self._position_for(hit - self._search_off)
+            if pos != last_pos:
+                last_pos = pos
+                yield pos, self._name_length(pos)
+            # Skip to the next name; one hit per row is enough.
+            next_start = self._search_off + (self._name_start(pos + 1) if pos + 1 < self._count else self._search_end - self._search_off)
+            start = max(next_start, hit + 1)
+
+    def search(
+        self,
+        query_l: str,
+        limit: int,
+        *,
+        tags: Optional[Iterable[str]] = None,
+        match_all_tags: bool = False,
+        categories: Optional[Iterable[str]] = None,
+    ) -> List[Tuple[float, int]]:
+        """
+        Returns the best ``limit`` ``(score, position)`` pairs using the same scoring as the bundled catalogue.
+        """
+        tag_filter = {str(tag).lower() for tag in tags} if tags else None
+        category_filter = {str(cat).lower() for cat in categories} if categories else None
+
+        def accepted(pos: int) -> bool:
+            if tag_filter:
+                row_tags = {tag.lower() for tag in self.tags(pos)}
+                if match_all_tags and not tag_filter <= row_tags:
+                    return False
+                if not match_all_tags and not (tag_filter & row_tags):
+                    return False
+            if category_filter and self.category(pos).lower() not in category_filter:
+                return False
+            return True
+
+        if not query_l:
+            # Every row scores the same, so the first accepted rows win.
+            browse = ((1.0, pos) for pos in range(self._count) if accepted(pos))
+            return list(itertools.islice(browse, max(limit, 0)))
+
+        matches = (
+            (0.9 + len(query_l) / max(length, 1), pos)
+            for pos, length in self.find_positions(query_l)
+            if accepted(pos)
+        )
+        return heapq.nlargest(limit, matches, key=lambda pair: (pair[0], -pair[1]))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Uso: python -m services.catalog_mmap <foods.json> <salida.bin>")
+        sys.exit(1)
+    with open(sys.argv[1], "r", encoding="utf-8") as fh:
+        source_items = json.load(fh)
+    written = write_catalog(source_items, Path(sys.argv[2]))
+    print(f"{written} alimentos escritos en {sys.argv[2]}")
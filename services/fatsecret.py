@@ -1,17 +1,37 @@
 import base64
+import contextvars
 import hmac
-import json
+import threading
 import time
 import urllib.parse
-import urllib.request
+from copy import deepcopy
 from hashlib import sha1
 from random import SystemRandom
 from typing import Dict, List, Optional, Tuple
 
+from services.cache import TTLCache
+from services.health import get_provider_health
+from services.http_transport import get_transport
+from services.rate_limit import TokenBucket, get_daily_quota
+from services.singleflight import SingleFlight
+
 
 FATSECRET_API_URL = "https://platform.fatsecret.com/rest/server.api"
 _RANDOM = SystemRandom()
 
+# Response cache TTL per API method; unknown methods are not cached.
+_CACHE_TTLS: Dict[str, float] = {
+    "foods.search": 24 * 60 * 60,
+    "food.get": 7 * 24 * 60 * 60,
+}
+DETAIL_CACHE_TTL = 7 * 24 * 60 * 60
+_DETAIL_NAMESPACE = "fatsecret-detail"
+# Error payload codes that mean the service itself failed (1: unknown error, 12: too many
+# actions); the rest (bad signature, missing parameters, invalid ids) are the caller's fault.
+PROVIDER_ERROR_CODES = frozenset({1, 12})
+# Identical requests in flight at the same time (any client instance) share one upstream call.
+_inflight = SingleFlight()
+
 # FatSecret exposes a limited nutrient set per porción; we capture the most relevant.
 _SERVING_NUTRIENT_UNITS: Dict[str, str] = {
     "saturated_fat": "g",
@@ -39,6 +59,13 @@ class FatSecretError(Exception):
     """Raised when the FatSecret API call fails."""
 
 
+class FatSecretQuotaError(FatSecretError):
+    """Raised when the daily quota is spent or the rate limiter cannot grant a call in time."""
+
+    # Refused before reaching the provider, so it says nothing about its health.
+    provider_failure = False
+
+
 def _to_float(value) -> float:
     try:
         if value in (None, "", "--"):
@@ -78,6 +105,153 @@ def _extract_serving_nutrients(raw: Dict) -> Dict[str, Tuple[float, str]]:
     return nutrients
 
 
+def _serving_macros(raw: Dict) -> Dict[str, float]:
+    return {
+        "kcal": _to_float(raw.get("calories")),
+        "p": _to_float(raw.get("protein")),
+        "c": _to_float(raw.get("carbohydrate")),
+        "g": _to_float(raw.get("fat") or raw.get("total_fat")),
+    }
+
+
+def _serving_grams(raw: Dict) -> float:
+    metric_amount = _to_float(raw.get("metric_serving_amount"))
+    metric_unit = (raw.get("metric_serving_unit") or "").lower()
+    if metric_unit == "g" and metric_amount > 0:
+        return metric_amount
+    serving_weight = _to_float(raw.get("serving_weight_grams"))
+    if serving_weight > 0:
+        return serving_weight
+    if metric_unit == "ml" and metric_amount > 0:
+        return metric_amount
+    return 0.0
+
+
+def _preferred_serving_index(servings_raw: List[Dict]) -> int:
+    """
+    Index of the serving shown in result lists: the first one with a weight,
+    replaced by any later weighed serving with a larger macro sum.
+    """
+    preferred_index = -1
+    prev_grams = 0.0
+    prev_macro_sum = 0.0
+    for idx, raw in enumerate(servings_raw):
+        grams = _serving_grams(raw)
+        macro_sum = sum(_serving_macros(raw).values())
+        if preferred_index == -1 or prev_grams <= 0 < grams or (grams > 0 and macro_sum > prev_macro_sum):
+            preferred_index = idx
+            prev_grams = grams
+            prev_macro_sum = macro_sum
+    return preferred_index
+
+
+def _parse_serving(raw: Dict, idx: int, *, with_nutrients: bool = True) -> Dict:
+    grams = _serving_grams(raw)
+    description = raw.get("serving_description") or raw.get("measurement_description") or ""
+    serving = {
+        "id": str(raw.get("serving_id") or idx),
+        "description": description or (f"por {grams:.0f} g" if grams > 0 else "porcion sugerida"),
+        "grams": grams,
+        "macros": _serving_macros(raw),
+    }
+    if with_nutrients:
+        serving["nutrients"] = _extract_serving_nutrients(raw)
+    return serving
+
+
+def expand_servings(food: Dict) -> List[Dict]:
+    """
+    Full serving table of ``food`` (with nutrients), parsed from the raw FatSecret
+    payload on first access and kept on the food. Foods without raw servings
+    return whatever ``servings`` they already carry.
+    """
+    servings_raw = food.get("servings_raw")
+    if servings_raw is not None and "servings" not in food:
+        food["servings"] = [_parse_serving(raw, idx) for idx, raw in enumerate(servings_raw)]
+    # Once parsed, the raw payload is dropped so cached and persisted copies stay small.
+    food.pop("servings_raw", None)
+    return food.get("servings") or []
+
+
+def _search_params(query: str, limit: int, region: Optional[str], language: Optional[str]) -> Dict[str, str]:
+    return _apply_market(
+        {
+            "method": "foods.search",
+            "search_expression": query,
+            "max_results": str(limit),
+            "page_number": "0",
+            "include_sub_categories": "true",
+            "format": "json",
+        },
+        region,
+        language,
+    )
+
+
+def _food_get_params(food_id: str, region: Optional[str], language: Optional[str]) -> Dict[str, str]:
+    return _apply_market(
+        {
+            "method": "food.get",
+            "food_id": str(food_id),
+            "format": "json",
+        },
+        region,
+        language,
+    )
+
+
+def _food_ids(response: Dict) -> List[str]:
+    foods_payload = response.get("foods", {}).get("food")
+    if not foods_payload:
+        return []
+    foods_list = foods_payload if isinstance(foods_payload, list) else [foods_payload]
+    return [str(item.get("food_id")) for item in foods_list if item.get("food_id")]
+
+
+def _ranked_details(food_ids: List[str], details: Dict[str, Dict], limit: int) -> List[Dict]:
+    normalised: List[Dict] = []
+    for food_id in food_ids:
+        data = details.get(food_id)
+        if data:
+            normalised.append(deepcopy(data))
+        if len(normalised) >= limit:
+            break
+    return normalised
+
+
+def _food_from_response(response: Dict) -> Dict:
+    food = response.get("food")
+    if not food:
+        raise FatSecretError("Empty food payload.")
+    return food
+
+
+def is_provider_error(error) -> bool:
+    """
+    Whether a FatSecret ``{"error": {...}}`` body should count against the circuit breaker.
+    """
+    try:
+        return int(error.get("code")) in PROVIDER_ERROR_CODES
+    except (AttributeError, TypeError, ValueError):
+        return True
+
+
+def _check_payload(payload: Dict) -> Dict:
+    if "error" in payload:
+        error = payload["error"] or {}
+        exc = FatSecretError(error.get("message", "Unknown FatSecret error"))
+        # Only server-side errors count against the circuit breaker; bad parameters do not.
+        exc.provider_failure = is_provider_error(error)
+        raise exc
+    return payload
+
+
+def _detail_key(food_id: str, region: Optional[str], language: Optional[str]) -> str:
+    from services.http_cache import canonical_key
+
+    return canonical_key(_DETAIL_NAMESPACE, {"food_id": food_id, "region": region or "", "language": language or ""})
+
+
 class FatSecretClient:
     def __init__(
         self,
@@ -86,6 +260,12 @@ class FatSecretClient:
         *,
         default_region: Optional[str] = None,
         default_language: Optional[str] = None,
+        max_concurrency: int = 4,
+        search_deadline: float = 8.0,
+        detail_cache_size: int = 512,
+        persist_details: bool = True,
+        rate_limit: float = 5.0,
+        daily_quota: int = 5000,
     ):
         if not consumer_key or not consumer_secret:
             raise ValueError("FatSecret consumer key and secret are required.")
@@ -93,6 +273,20 @@ class FatSecretClient:
         self.consumer_secret = consumer_secret
         self.default_region = default_region
         self.default_language = default_language
+        # food.get calls per search run on a bounded pool so API quotas are respected.
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.search_deadline = search_deadline
+        # concurrent.futures, asyncio and the HTTP cache are imported on first use; they
+        # are slow to import and not every caller needs them.
+        self._executor: Optional["ThreadPoolExecutor"] = None
+        self._executor_lock = threading.Lock()
+        # Normalised foods keyed by (food_id, region, language); {} marks foods without usable servings.
+        self._detail_cache = TTLCache(maxsize=detail_cache_size, default_ttl=DETAIL_CACHE_TTL)
+        self.persist_details = persist_details
+        self.health = get_provider_health("fatsecret")
+        # Calls per second (bursts up to 2x) and per UTC day; daily_quota <= 0 disables the daily cap.
+        self._bucket = TokenBucket(rate_limit, capacity=2 * rate_limit)
+        self.daily_quota = int(daily_quota)
 
     def search_foods(
         self,
@@ -110,43 +304,182 @@ class FatSecretClient:
         region = region or self.default_region
         language = language or self.default_language
 
-        payload = _apply_market(
-            {
-                "method": "foods.search",
-                "search_expression": query,
-                "max_results": str(limit),
-                "page_number": "0",
-                "include_sub_categories": "true",
-                "format": "json",
-            },
-            region,
-            language,
-        )
+        response = self._request(_search_params(query, limit, region, language))
+        food_ids = _food_ids(response)
+        details, missing = self._split_cached(food_ids, region, language)
+        for detail_payload in self._fetch_foods(missing, region=region, language=language):
+            self._remember_detail(detail_payload, details, region, language)
+        return _ranked_details(food_ids, details, limit)
+
+    async def search_foods_async(
+        self,
+        query: str,
+        limit: int = 8,
+        *,
+        region: Optional[str] = None,
+        language: Optional[str] = None,
+    ) -> List[Dict]:
+        """
+        Coroutine version of :meth:`search_foods` on the shared asyncio transport.
+        Detail fetches run as tasks bounded by ``max_concurrency`` and ``search_deadline``.
+        """
+        import asyncio
 
-        response = self._request(payload)
-        foods_payload = response.get("foods", {}).get("food")
-        if not foods_payload:
+        query = (query or "").strip()
+        if not query:
             return []
 
-        foods_list = foods_payload if isinstance(foods_payload, list) else [foods_payload]
+        limit = max(1, min(limit, 20))
+        region = region or self.default_region
+        language = language or self.default_language
+
+        response = await self._request_async(_search_params(query, limit, region, language))
+        food_ids = _food_ids(response)
+        # The detail cache may hit SQLite, so it is consulted off the event loop.
+        details, missing = await asyncio.to_thread(self._split_cached, food_ids, region, language)
+        for detail_payload in await self._fetch_foods_async(missing, region=region, language=language):
+            await asyncio.to_thread(self._remember_detail, detail_payload, details, region, language)
+        return _ranked_details(food_ids, details, limit)
+
+    def _split_cached(
+        self,
+        food_ids: List[str],
+        region: Optional[str],
+        language: Optional[str],
+    ) -> Tuple[Dict[str, Dict], List[str]]:
+        details: Dict[str, Dict] = {}
+        missing: List[str] = []
+        for food_id in food_ids:
+            cached = self._cached_detail(food_id, region, language)
+            if cached is None:
+                missing.append(food_id)
+            else:
+                details[food_id] = cached
+        return details, missing
+
+    def _remember_detail(
+        self,
+        detail_payload: Dict,
+        details: Dict[str, Dict],
+        region: Optional[str],
+        language: Optional[str],
+    ) -> None:
         market = {k: v for k, v in (("region", region), ("language", language)) if v}
+        food_id = str(detail_payload.get("food_id"))
+        data = self._normalise_food(detail_payload, market=market or None) or {}
+        self._store_detail(food_id, region, language, data)
+        details[food_id] = data
+
+    def _cached_detail(self, food_id: str, region: Optional[str], language: Optional[str]) -> Optional[Dict]:
+        key = (food_id, region, language)
+        data = self._detail_cache.get(key)
+        if data is not None:
+            return data
+        if not self.persist_details:
+            return None
+        from services.http_cache import get_response_cache
 
-        normalised: List[Dict] = []
-        for item in foods_list:
-            food_id = item.get("food_id")
-            if not food_id:
+        store = get_response_cache()
+        if store is None:
+            return None
+        data = store.get(_detail_key(food_id, region, language))
+        if data is not None:
+            self._detail_cache.set(key, data)
+        return data
+
+    def _store_detail(self, food_id: str, region: Optional[str], language: Optional[str], data: Dict) -> None:
+        self._detail_cache.set((food_id, region, language), data)
+        if not self.persist_details:
+            return
+        from services.http_cache import get_response_cache
+
+        store = get_response_cache()
+        if store is not None:
+            store.set(_detail_key(food_id, region, language), _DETAIL_NAMESPACE, data, DETAIL_CACHE_TTL)
+
+    def detail_cache_stats(self) -> Dict[str, float]:
+        return self._detail_cache.stats()
+
+    @staticmethod
+    def coalescing_stats() -> Dict[str, float]:
+        return _inflight.stats()
+
+    def _pool(self) -> "ThreadPoolExecutor":
+        from concurrent.futures import ThreadPoolExecutor
+
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency,
+                    thread_name_prefix="fatsecret",
+                )
+            return self._executor
+
+    def close(self) -> None:
+        """
+        Releases the detail pool; running fetches finish in the background.
+        """
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _fetch_foods(
+        self,
+        food_ids: List[str],
+        *,
+        region: Optional[str] = None,
+        language: Optional[str] = None,
+    ) -> List[Dict]:
+        """
+        Fetches food.get payloads concurrently, keeping the order of ``food_ids``.
+        Calls still pending when ``search_deadline`` expires are dropped from the result;
+        failed calls are skipped.
+        """
+        if not food_ids:
+            return []
+        if len(food_ids) == 1 or self.max_concurrency == 1:
+            return self._fetch_foods_serial(food_ids, region=region, language=language)
+
+        from concurrent.futures import Future, wait
+
+        pool = self._pool()
+        futures: List[Future] = [
+            # Pool threads do not inherit context variables; each call runs in a copy of
+            # ours so the caller's request lane reaches the rate limiter.
+            pool.submit(contextvars.copy_context().run, self._fetch_food, food_id, region=region, language=language)
+            for food_id in food_ids
+        ]
+        wait(futures, timeout=self.search_deadline)
+
+        payloads: List[Dict] = []
+        for future in futures:
+            if not future.done():
+                future.cancel()
                 continue
             try:
-                detail_payload = self._fetch_food(food_id, region=region, language=language)
+                payloads.append(future.result())
             except FatSecretError:
                 continue
-            data = self._normalise_food(detail_payload, market=market or None)
-            if data:
-                normalised.append(data)
-            if len(normalised) >= limit:
-                break
+        return payloads
 
-        return normalised
+    def _fetch_foods_serial(
+        self,
+        food_ids: List[str],
+        *,
+        region: Optional[str] = None,
+        language: Optional[str] = None,
+    ) -> List[Dict]:
+        deadline = time.monotonic() + self.search_deadline
+        payloads: List[Dict] = []
+        for food_id in food_ids:
+            if time.monotonic() >= deadline:
+                break
+            try:
+                payloads.append(self._fetch_food(food_id, region=region, language=language))
+            except FatSecretError:
+                continue
+        return payloads
 
     def _fetch_food(
         self,
@@ -155,20 +488,53 @@ class FatSecretClient:
         region: Optional[str] = None,
         language: Optional[str] = None,
     ) -> Dict:
-        payload = _apply_market(
-            {
-                "method": "food.get",
-                "food_id": str(food_id),
-                "format": "json",
-            },
-            region,
-            language,
-        )
-        response = self._request(payload)
-        food = response.get("food")
-        if not food:
-            raise FatSecretError("Empty food payload.")
-        return food
+        response = self._request(_food_get_params(food_id, region, language))
+        return _food_from_response(response)
+
+    async def _fetch_food_async(
+        self,
+        food_id: str,
+        *,
+        region: Optional[str] = None,
+        language: Optional[str] = None,
+    ) -> Dict:
+        response = await self._request_async(_food_get_params(food_id, region, language))
+        return _food_from_response(response)
+
+    async def _fetch_foods_async(
+        self,
+        food_ids: List[str],
+        *,
+        region: Optional[str] = None,
+        language: Optional[str] = None,
+    ) -> List[Dict]:
+        import asyncio
+
+        if not food_ids:
+            return []
+        limit = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch(food_id: str) -> Dict:
+            async with limit:
+                return await self._fetch_food_async(food_id, region=region, language=language)
+
+        tasks = [asyncio.ensure_future(fetch(food_id)) for food_id in food_ids]
+        try:
+            await asyncio.wait(tasks, timeout=self.search_deadline)
+        finally:
+            late = [task for task in tasks if not task.done()]
+            for task in late:
+                task.cancel()
+            if late:
+                # Cancelled fetches are awaited so they release their slot and connection.
+                await asyncio.gather(*late, return_exceptions=True)
+
+        payloads: List[Dict] = []
+        for task in tasks:
+            if task.cancelled() or task.exception() is not None:
+                continue
+            payloads.append(task.result())
+        return payloads
 
     def _normalise_food(self, food: Dict, *, market: Optional[Dict[str, str]] = None) -> Optional[Dict]:
         servings_payload = food.get("servings", {}).get("serving")
@@ -176,58 +542,13 @@ class FatSecretClient:
             return None
         servings_raw = servings_payload if isinstance(servings_payload, list) else [servings_payload]
 
-        servings: List[Dict] = []
-        preferred_index = -1
-
-        for idx, raw in enumerate(servings_raw):
-            description = raw.get("serving_description") or raw.get("measurement_description") or ""
-            macros = {
-                "kcal": _to_float(raw.get("calories")),
-                "p": _to_float(raw.get("protein")),
-                "c": _to_float(raw.get("carbohydrate")),
-                "g": _to_float(raw.get("fat") or raw.get("total_fat")),
-            }
-
-            grams = 0.0
-            metric_amount = _to_float(raw.get("metric_serving_amount"))
-            metric_unit = (raw.get("metric_serving_unit") or "").lower()
-            serving_weight = _to_float(raw.get("serving_weight_grams"))
-            if metric_unit == "g" and metric_amount > 0:
-                grams = metric_amount
-            elif serving_weight > 0:
-                grams = serving_weight
-            elif metric_unit == "ml" and metric_amount > 0:
-                grams = metric_amount
-
-            serving_id = str(raw.get("serving_id") or idx)
-            nutrients = _extract_serving_nutrients(raw)
-
-            servings.append(
-                {
-                    "id": serving_id,
-                    "description": description or (f"por {grams:.0f} g" if grams > 0 else "porcion sugerida"),
-                    "grams": grams,
-                    "macros": macros,
-                    "nutrients": nutrients,
-                }
-            )
-
-            if preferred_index == -1:
-                preferred_index = idx
-            else:
-                previous = servings[preferred_index]
-                prev_grams = previous["grams"]
-                prev_macro_sum = sum(previous["macros"].values())
-                current_macro_sum = sum(macros.values())
-                if prev_grams <= 0 < grams:
-                    preferred_index = idx
-                elif grams > 0 and current_macro_sum > prev_macro_sum:
-                    preferred_index = idx
-
+        # Only the preferred serving is parsed here; the full table is built by
+        # expand_servings once the food is opened.
+        preferred_index = _preferred_serving_index(servings_raw)
         if preferred_index == -1:
             return None
 
-        preferred_serving = servings[preferred_index]
+        preferred_serving = _parse_serving(servings_raw[preferred_index], preferred_index, with_nutrients=False)
         if not any(preferred_serving["macros"].values()):
             return None
 
@@ -248,13 +569,8 @@ class FatSecretClient:
                 "grams": grams if grams > 0 else 100.0,
                 "description": portion_desc,
             },
-            "macros": {
-                "kcal": preferred_serving["macros"]["kcal"],
-                "p": preferred_serving["macros"]["p"],
-                "c": preferred_serving["macros"]["c"],
-                "g": preferred_serving["macros"]["g"],
-            },
-            "servings": servings,
+            "macros": dict(preferred_serving["macros"]),
+            "servings_raw": servings_raw,
         }
 
         if market:
@@ -263,23 +579,88 @@ class FatSecretClient:
         return normalised
 
     def _request(self, params: Dict[str, str]) -> Dict:
-        oauth_params = self._build_oauth_params()
-        all_params = {**params, **oauth_params}
-        signature = self._sign(all_params)
-        signed_params = {**all_params, "oauth_signature": signature}
+        from services.http_cache import cached_request, canonical_key
+
+        ttl = _CACHE_TTLS.get(params.get("method", ""), 0)
+        return _inflight.do(
+            canonical_key("fatsecret", params),
+            lambda: cached_request("fatsecret", params, lambda: self._send(params), ttl=ttl),
+        )
+
+    def _send(self, params: Dict[str, str]) -> Dict:
+        self._check_circuit()
+        try:
+            if not self._bucket.acquire(timeout=self.search_deadline):
+                raise FatSecretQuotaError("FatSecret: límite de llamadas por segundo alcanzado.")
+            self._consume_quota()
+        except BaseException:
+            self.health.cancel()
+            raise
+        try:
+            with self.health.track():
+                return _check_payload(
+                    get_transport().request("GET", self._signed_url(params), timeout=self.health.timeout()).json()
+                )
+        except FatSecretError:
+            raise
+        except Exception as exc:
+            raise FatSecretError(str(exc)) from exc
 
-        query_string = _normalise_param_pairs(signed_params)
-        url = f"{FATSECRET_API_URL}?{query_string}"
+    async def _request_async(self, params: Dict[str, str]) -> Dict:
+        from services.http_cache import cached_request_async, canonical_key
 
+        ttl = _CACHE_TTLS.get(params.get("method", ""), 0)
+        return await _inflight.do_async(
+            canonical_key("fatsecret", params),
+            lambda: cached_request_async("fatsecret", params, lambda: self._send_async(params), ttl=ttl),
+        )
+
+    async def _send_async(self, params: Dict[str, str]) -> Dict:
+        import asyncio
+
+        from services.async_http import get_async_transport
+
+        self._check_circuit()
         try:
-            with urllib.request.urlopen(url, timeout=6) as response:
-                payload = json.loads(response.read().decode("utf-8"))
+            if not await self._bucket.acquire_async(timeout=self.search_deadline):
+                raise FatSecretQuotaError("FatSecret: límite de llamadas por segundo alcanzado.")
+            await asyncio.to_thread(self._consume_quota)
+        except BaseException:
+            self.health.cancel()
+            raise
+        try:
+            with self.health.track():
+                response = await get_async_transport().request(
+                    "GET", self._signed_url(params), timeout=self.health.timeout()
+                )
+                return _check_payload(response.json())
+        except FatSecretError:
+            raise
         except Exception as exc:
             raise FatSecretError(str(exc)) from exc
 
-        if "error" in payload:
-            raise FatSecretError(payload["error"].get("message", "Unknown FatSecret error"))
-        return payload
+    def _check_circuit(self) -> None:
+        if not self.health.allow():
+            raise FatSecretError("FatSecret no responde; se omite temporalmente.")
+
+    def _consume_quota(self) -> None:
+        # Once the day's budget is spent, callers fall back to cached responses, USDA and the local catalogue.
+        if not get_daily_quota().consume("fatsecret", self.daily_quota):
+            raise FatSecretQuotaError("FatSecret: cuota diaria agotada; se usan USDA y el catálogo local.")
+
+    def quota_stats(self) -> Dict[str, object]:
+        return {
+            "limiter": self._bucket.stats(),
+            "used_today": get_daily_quota().used("fatsecret"),
+            "daily_quota": self.daily_quota,
+        }
+
+    def _signed_url(self, params: Dict[str, str]) -> str:
+        oauth_params = self._build_oauth_params()
+        all_params = {**params, **oauth_params}
+        signature = self._sign(all_params)
+        signed_params = {**all_params, "oauth_signature": signature}
+        return f"{FATSECRET_API_URL}?{_normalise_param_pairs(signed_params)}"
 
     def _build_oauth_params(self) -> Dict[str, str]:
         return {
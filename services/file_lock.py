@@ -0,0 +1,80 @@
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:  # pragma: no cover - POSIX
+    msvcrt = None
+
+
+class FileLock:
+    """
+    Exclusive lock shared by every process on the machine through a sidecar file
+    (flock on POSIX, msvcrt on Windows). Re-entrant within the thread that holds it,
+    so a locked read-modify-write may call other locked helpers.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        with self._thread_lock:
+            if self._depth:
+                # Re-entered by the thread that already holds the file lock.
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                handle = open(self.path, "a+b")
+            except OSError:
+                # No writable directory: fall back to in-process locking only.
+                yield
+                return
+            try:
+                _lock_file(handle)
+                self._depth = 1
+                try:
+                    yield
+                finally:
+                    self._depth = 0
+                    _unlock_file(handle)
+            finally:
+                handle.close()
+
+
+def lock_path_for(path: Path) -> Path:
+    """
+    Sidecar ``.lock`` file guarding ``path``.
+    """
+    path = Path(path)
+    return path.with_suffix(path.suffix + ".lock")
+
+
+def _lock_file(handle) -> None:
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+    elif msvcrt is not None:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _unlock_file(handle) -> None:
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,154 @@
+import math
+import re
+import unicodedata
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+
+# Added to the text score per provider, so at equal relevance the user's own and
+# offline foods come before remote ones.
+SOURCE_WEIGHTS: Dict[str, float] = {
+    "custom": 0.3,
+    "learned": 0.25,
+    "local": 0.2,
+    "fatsecret": 0.1,
+    "usda": 0.0,
+}
+# Providers already rank their own results; the first hit of each gets up to this much.
+RANK_WEIGHT = 0.2
+
+# Two foods are the same when their name tokens overlap this much (Jaccard), their
+# brands agree (or one is missing) and their macros per 100 g are close.
+NAME_SIMILARITY = 0.75
+MACRO_COSINE = 0.97
+KCAL_TOLERANCE = 0.15
+# Names are blocked on their longest tokens' prefixes; only foods sharing a block are compared.
+BLOCK_TOKENS = 2
+BLOCK_PREFIX = 5
+
+_STOPWORDS = frozenset(
+    {"de", "del", "la", "el", "los", "las", "con", "y", "en", "al", "a", "of", "with", "and", "the", "in"}
+)
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalise_text(value) -> str:
+    """
+    Lower case ASCII form of ``value`` with punctuation collapsed to single spaces.
+    """
+    text = unicodedata.normalize("NFKD", str(value or "")).encode("ascii", "ignore").decode("ascii")
+    return " ".join(_NON_WORD.split(text.lower())).strip()
+
+
+def name_tokens(name: str) -> FrozenSet[str]:
+    return frozenset(token for token in normalise_text(name).split() if token not in _STOPWORDS)
+
+
+def text_score(query_l: str, name: str) -> float:
+    """
+    Relevance of a lower case ``name`` for a lower case query: substring matches score
+    above 0.9, otherwise the share of name words starting with the query.
+    """
+    if not query_l:
+        return 1.0
+    if query_l in name:
+        return 0.9 + len(query_l) / max(len(name), 1)
+    name_words = name.split()
+    matches = sum(1 for w in name_words if w.startswith(query_l))
+    return matches / len(name_words) if name_words else 0.0
+
+
+def macros_per_100g(food: Dict) -> Tuple[float, float, float, float]:
+    macros = food.get("macros", {}) or {}
+    grams = float((food.get("portion", {}) or {}).get("grams") or 100)
+    ratio = 100.0 / grams if grams > 0 else 1.0
+    return tuple(float(macros.get(key, 0.0) or 0.0) * ratio for key in ("kcal", "p", "c", "g"))
+
+
+class _Candidate:
+    __slots__ = ("food", "score", "tokens", "brand", "vector", "blocks")
+
+    def __init__(self, food: Dict, score: Tuple[bool, bool, float]):
+        self.food = food
+        self.score = score
+        self.tokens = name_tokens(food.get("name") or "")
+        self.brand = normalise_text(food.get("brand"))
+        self.vector = macros_per_100g(food)
+        longest = sorted(self.tokens, key=lambda token: (-len(token), token))[:BLOCK_TOKENS]
+        self.blocks = [token[:BLOCK_PREFIX] for token in longest] or [normalise_text(food.get("name"))]
+
+
+def _same_food(a: _Candidate, b: _Candidate) -> bool:
+    if a.brand and b.brand and a.brand != b.brand:
+        return False
+    union = a.tokens | b.tokens
+    if union and len(a.tokens & b.tokens) / len(union) < NAME_SIMILARITY:
+        return False
+    kcal_a, kcal_b = a.vector[0], b.vector[0]
+    if abs(kcal_a - kcal_b) > max(15.0, KCAL_TOLERANCE * max(kcal_a, kcal_b)):
+        return False
+    macros_a, macros_b = a.vector[1:], b.vector[1:]
+    norm = math.sqrt(sum(x * x for x in macros_a)) * math.sqrt(sum(y * y for y in macros_b))
+    if not norm:
+        # Both without macros (or one of them): rely on the name and energy checks.
+        return not any(macros_a) and not any(macros_b)
+    return sum(x * y for x, y in zip(macros_a, macros_b)) / norm >= MACRO_COSINE
+
+
+def merge_results(
+    results: Dict[str, List[Dict]],
+    query: str,
+    limit: int,
+    *,
+    boost: Optional[Callable[[Optional[str]], float]] = None,
+    demote_tags: Optional[Iterable[str]] = None,
+    expansions: Optional[Iterable[Tuple[str, float]]] = None,
+) -> List[Dict]:
+    """
+    Merges per-provider result lists (keys of :data:`SOURCE_WEIGHTS`) into one ranked list.
+    Each food scores its text relevance plus its provider weight, its rank within the
+    provider and ``boost(food_id)``; near-identical foods from different providers are
+    collapsed into the best scoring one. ``expansions`` are weighted alternatives of the
+    query (see services.query_expansion); a food's text relevance is its best weighted match.
+    Scores only order foods within a tier: foods matching the query itself come before
+    those only a weaker alternative matches, and foods carrying one of ``demote_tags``
+    come after every other match but still fill the list when nothing else answers.
+    """
+    queries = [(normalise_text(term), weight) for term, weight in expansions or [(query, 1.0)]]
+    demoted = {str(tag).lower() for tag in demote_tags or ()}
+
+    candidates: List[_Candidate] = []
+    for provider, foods in results.items():
+        weight = SOURCE_WEIGHTS.get(provider, 0.0)
+        for rank, food in enumerate(foods or []):
+            name = normalise_text(food.get("name"))
+            matches = [(term_weight, text_score(term, name)) for term, term_weight in queries]
+            relevance = max(term_weight * match for term_weight, match in matches)
+            literal = any(match > 0 for term_weight, match in matches if term_weight >= 1.0)
+            score = relevance + weight + RANK_WEIGHT / (rank + 1)
+            if boost:
+                score += boost(food.get("id"))
+            is_demoted = bool(demoted & {str(tag).lower() for tag in food.get("tags") or []})
+            candidates.append(_Candidate(food, (not is_demoted, literal, score)))
+    candidates.sort(key=lambda candidate: candidate.score, reverse=True)
+
+    merged: List[Dict] = []
+    seen_ids = set()
+    blocks: Dict[str, List[_Candidate]] = {}
+    for candidate in candidates:
+        food_id = candidate.food.get("id")
+        if food_id and food_id in seen_ids:
+            continue
+        if any(
+            _same_food(candidate, kept)
+            for block in candidate.blocks
+            for kept in blocks.get(block, ())
+        ):
+            continue
+        if food_id:
+            seen_ids.add(food_id)
+        for block in candidate.blocks:
+            blocks.setdefault(block, []).append(candidate)
+        merged.append(candidate.food)
+        if len(merged) >= limit:
+            break
+    return merged
@@ -1,25 +1,82 @@
-import json
+import contextvars
+import math
 import os
-import ssl
+import threading
+import time
 import urllib.parse
-import urllib.request
+from copy import deepcopy
 from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Tuple
-
-from data.argentina_meta import ARGENTINA_PRODUCTS_META
-from services.fatsecret import FatSecretClient, FatSecretError
-
-
-LOCAL_DB_PATH = Path(__file__).resolve().parent.parent / "data" / "foods.json"
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from data.storage import custom_foods_version, get_food_usage_scores, list_custom_foods
+from services.barcodes import get_barcode_store, normalise_barcode
+from services.cache import TTLCache
+from services.catalog_build import load_catalog
+from services.catalog_index import CatalogIndex, iter_positions
+from services.catalog_mmap import MappedCatalog, MappedCatalogError
+from services.food_merge import merge_results, text_score
+from services.fatsecret import FatSecretClient, FatSecretError, expand_servings  # expand_servings re-exported
+from services.health import get_provider_health
+from services.http_transport import get_transport
+from services.learned_foods import get_learned_store
+from services.query_expansion import expand_query
+from services.macro_batch import scale_macros_batch, scale_macros_each  # re-exported batch API
+from services.singleflight import SingleFlight
+from services.usda_nutrients import NUTRIENT_MAP, extract_usda_macros  # NUTRIENT_MAP re-exported
+
+
+MAPPED_CATALOG_PATH = Path(__file__).resolve().parent.parent / "data" / "foods.bin"
 USDA_API_URL = "https://api.nal.usda.gov/fdc/v1/foods/search"
-
-NUTRIENT_MAP = {
-    "Protein": "p",
-    "Carbohydrate, by difference": "c",
-    "Total lipid (fat)": "g",
-    "Energy": "kcal",
+USDA_RESPONSE_TTL = 7 * 24 * 60 * 60
+
+# Result cache for search_foods; TTL depends on the provider that answered.
+SEARCH_CACHE_SIZE = 256
+SEARCH_CACHE_TTLS = {
+    "fatsecret": 6 * 60 * 60,
+    "usda": 24 * 60 * 60,
+    "local": 10 * 60,
+    "learned": 10 * 60,
+    "custom": 10 * 60,
 }
+SEARCH_CACHE_NEGATIVE_TTL = 60
+
+_search_cache = TTLCache(maxsize=SEARCH_CACHE_SIZE)
+_search_flight = SingleFlight()
+
+# Foods the user logs often/recently get up to this much added to their text score.
+USAGE_BOOST = 0.5
+# Usage score at which the boost reaches ~63% of USAGE_BOOST.
+USAGE_BOOST_SCALE = 3.0
+
+# Remote searches are skipped when this many learned foods already match the query.
+LEARNED_SATISFY_HITS = 3
+_learned_index_state: Tuple[Optional[Tuple], Optional[CatalogIndex]] = (None, None)
+_custom_index_state: Tuple[object, Optional[CatalogIndex]] = (None, None)
+# Barcode -> (food, prebuilt) for lookup_barcode; prebuilt foods are already normalised.
+_barcode_index_state: Tuple[object, Dict[str, Tuple[Dict, bool]]] = (None, {})
+_mapped_catalog_state: Tuple[object, Optional[MappedCatalog]] = (None, None)
+
+# Fan-out search: every configured provider runs at once under a single latency budget.
+SEARCH_BUDGET = 5.0
+# How often a cancellable fan-out checks whether it was superseded while providers run.
+CANCEL_POLL_INTERVAL = 0.1
+# asyncio, concurrent.futures and the HTTP clients are imported where they are used:
+# together they would add most of this module's import time to every app start.
+_fanout_pool: Optional["ThreadPoolExecutor"] = None
+_fanout_pool_lock = threading.Lock()
+
+
+def _submit(fn: Callable, *args) -> "Future":
+    global _fanout_pool
+    with _fanout_pool_lock:
+        if _fanout_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            _fanout_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="food-search")
+    # Pool threads do not inherit context variables; run in a copy of ours so the
+    # caller's request lane reaches the provider's rate limiter.
+    return _fanout_pool.submit(contextvars.copy_context().run, fn, *args)
 
 
 class FoodLookupError(Exception):
@@ -27,54 +84,545 @@ class FoodLookupError(Exception):
 
 
 @lru_cache
+def _local_index() -> CatalogIndex:
+    return load_catalog()
+
+
 def _load_local_foods() -> List[Dict]:
-    if not LOCAL_DB_PATH.exists():
-        return []
-    with LOCAL_DB_PATH.open("r", encoding="utf-8") as fh:
-        data = json.load(fh)
-    return data
+    return _local_index().items
+
+
+def _mapped_catalog() -> Optional[MappedCatalog]:
+    """
+    Large optional catalogue (see services.catalog_mmap), searched in place through mmap.
+    MACROENTRENO_CATALOG_PATH overrides the default data/foods.bin location. Reopened
+    when the file changes, so a USDA import shows up without restarting the app.
+    """
+    global _mapped_catalog_state
+    path = Path(os.getenv("MACROENTRENO_CATALOG_PATH") or MAPPED_CATALOG_PATH)
+    try:
+        version = (path, os.stat(path).st_mtime_ns)
+    except OSError:
+        version = (path, None)
+    cached_version, catalog = _mapped_catalog_state
+    if version == cached_version:
+        return catalog
+    catalog = None
+    if version[1] is not None:
+        try:
+            catalog = MappedCatalog(path)
+        except MappedCatalogError:
+            pass
+    # The previous mapping is left to the garbage collector: a search may still be reading it.
+    _mapped_catalog_state = (version, catalog)
+    return catalog
+
+
+def _learned_index() -> CatalogIndex:
+    """
+    Index over the learned foods tier, rebuilt only when the store changes.
+    """
+    global _learned_index_state
+    store = get_learned_store()
+    current = store.version
+    version, index = _learned_index_state
+    if index is None or version != current:
+        foods = store.foods()
+        meta = {food["id"]: {"tags": food.get("tags") or [], "category": food.get("category")} for food in foods}
+        index = CatalogIndex(foods, meta)
+        _learned_index_state = (current, index)
+    return index
+
+
+def _custom_index() -> CatalogIndex:
+    """
+    Index over the user's custom foods, rebuilt only when one of them changes.
+    """
+    global _custom_index_state
+    version = custom_foods_version()
+    cached_version, index = _custom_index_state
+    if index is None or version != cached_version:
+        index = CatalogIndex(list_custom_foods())
+        _custom_index_state = (version, index)
+    return index
+
+
+def _barcode_index() -> Dict[str, Tuple[Dict, bool]]:
+    """
+    Hash index from EAN-13 codes to catalogue, learned and custom foods (in that order
+    of precedence, later wins) plus the bulk-loaded assignments of services.barcodes.
+    Rebuilt only when one of the sources changes.
+    """
+    global _barcode_index_state
+    store = get_barcode_store()
+    tiers = ((_local_index(), False), (_learned_index(), True), (_custom_index(), True))
+    version = (get_learned_store().version, custom_foods_version(), store.version)
+    cached_version, codes = _barcode_index_state
+    if cached_version == version:
+        return codes
+
+    codes = {}
+    by_id: Dict[str, Tuple[Dict, bool]] = {}
+    for catalog, prebuilt in tiers:
+        for item in catalog.items:
+            food_id = item.get("id")
+            if food_id:
+                by_id[food_id] = (item, prebuilt)
+            raw = item.get("barcode") or (catalog.meta.get(food_id) or {}).get("barcode")
+            code = normalise_barcode(raw) if raw else None
+            if code:
+                codes[code] = (item, prebuilt)
+    # A barcode on the food itself wins over a bulk assignment.
+    for code, food_id in store.items().items():
+        if code not in codes and food_id in by_id:
+            codes[code] = by_id[food_id]
+    _barcode_index_state = (version, codes)
+    return codes
+
+
+def lookup_barcode(code) -> Optional[Dict]:
+    """
+    Food for an EAN-13 (or UPC-A) barcode, or None when the code is invalid or unknown.
+    A dict lookup once the index is built, so scanned products skip text search; codes
+    it does not know are looked up in the mapped catalogue's sorted barcode table.
+    """
+    ean = normalise_barcode(code)
+    if not ean:
+        return None
+    hit = _barcode_index().get(ean)
+    if hit is None:
+        mapped = _mapped_catalog()
+        pos = mapped.find_barcode(ean) if mapped else None
+        if pos is None:
+            return None
+        hit = (mapped.record(pos), False)
+    item, prebuilt = hit
+    food = deepcopy(item) if prebuilt else _normalise_food(item, source=item.get("source") or "local")
+    food["barcode"] = ean
+    return food
+
+
+def promote_food(food: Dict) -> bool:
+    """
+    Keeps a logged FatSecret/USDA food (with its servings) in the learned tier so later
+    searches can find it locally. Returns False when the food is not learnable.
+    Cached searches are keyed on the store version, so they refresh on their own.
+    """
+    return get_learned_store().promote(food)
+
+
+def _learned_hits(query: str) -> int:
+    query_l = (query or "").lower()
+    if not query_l:
+        return 0
+    index = _learned_index()
+    return sum(1 for pos in iter_positions(index.text_bits(query_l)) if query_l in index.names[pos])
 
 
 def search_foods(query: str, limit: int = 8) -> List[Dict]:
     """
     Returns a list of food dictionaries ready to be scaled for macros.
-    The function tries the USDA FoodData Central API when an API key is present,
-    and falls back to the bundled local catalogue.
+    The bundled catalogue, custom and learned foods are searched together with
+    FatSecret and the USDA FoodData Central API (when credentials are present), and
+    the answers are merged into one de-duplicated ranking (see services.food_merge).
+    Queries already matched by enough learned foods (see :func:`promote_food`) are
+    answered locally. Providers still pending after :data:`SEARCH_BUDGET` are skipped.
+    Per-provider results are cached per query, limit, configured providers and market,
+    and identical searches running at the same time share one lookup. The personal
+    usage ranking is applied when merging, after the cache, so logging a food does
+    not invalidate cached searches.
     """
     query = (query or "").strip()
 
-    foods: List[Dict] = []
-
     client = _get_fatsecret_client()
-    if client and query:
+    api_key = os.getenv("FOODDATA_API_KEY")
+    cache_key = _search_cache_key(query, limit, client, api_key)
+    results = _search_cache.get(cache_key)
+    if results is None:
+        results = _search_flight.do(cache_key, lambda: _search_providers(query, limit, client, api_key, cache_key))
+    return deepcopy(_merge_results(results, query, limit))
+
+
+def _search_providers(
+    query: str,
+    limit: int,
+    client: Optional[FatSecretClient],
+    api_key: Optional[str],
+    cache_key: Tuple,
+) -> Dict[str, List[Dict]]:
+    results = _split_local(_search_local(query, limit))
+    futures = {}
+    if _needs_remote(query, limit):
+        if client:
+            futures[_submit(client.search_foods, query, limit)] = "fatsecret"
+        if api_key:
+            futures[_submit(_search_usda, query, api_key, limit)] = "usda"
+
+    from concurrent.futures import wait
+
+    # Same latency budget as the fan-out: a hung provider must not block the search.
+    done, pending = wait(futures, timeout=SEARCH_BUDGET) if futures else (set(), set())
+    failed = False
+    for future, provider in futures.items():
+        if future not in done:
+            future.cancel()
+            continue
         try:
-            foods = client.search_foods(query, limit)
-        except FatSecretError:
-            foods = []
+            results[provider] = future.result()
+        except (FatSecretError, FoodLookupError):
+            results[provider] = []
+            failed = True
+
+    # A late provider would have changed the list; leave it uncached so the next search asks again.
+    if not pending:
+        _search_cache.set(cache_key, results, _results_ttl(results, failed=failed))
+    return results
+
 
+async def search_foods_async(query: str, limit: int = 8) -> List[Dict]:
+    """
+    Coroutine version of :func:`search_foods` using the asyncio FatSecret and USDA clients,
+    so concurrent searches share one event loop and connection pool instead of a thread each.
+    """
+    import asyncio
+
+    query = (query or "").strip()
+
+    client = _get_fatsecret_client()
     api_key = os.getenv("FOODDATA_API_KEY")
-    if not foods and api_key and query:
-        try:
-            foods = _search_usda(query, api_key, limit)
-        except FoodLookupError:
-            foods = []
+    cache_key = await asyncio.to_thread(_search_cache_key, query, limit, client, api_key)
+    results = _search_cache.get(cache_key)
+    if results is None:
+        results = await _search_flight.do_async(
+            cache_key, lambda: _search_providers_async(query, limit, client, api_key, cache_key)
+        )
+    # The usage scores read the DB file, so the merge runs off the event loop.
+    return deepcopy(await asyncio.to_thread(_merge_results, results, query, limit))
+
+
+async def _search_providers_async(
+    query: str,
+    limit: int,
+    client: Optional[FatSecretClient],
+    api_key: Optional[str],
+    cache_key: Tuple,
+) -> Dict[str, List[Dict]]:
+    import asyncio
+
+    # Index scans read files, so local work runs off the event loop.
+    results = _split_local(await asyncio.to_thread(_search_local, query, limit))
+    tasks = await _start_remote_tasks(query, limit, client, api_key)
+    try:
+        # Same latency budget as the sync path: a hung provider must not block the search.
+        done, pending = await asyncio.wait(tasks, timeout=SEARCH_BUDGET) if tasks else (set(), set())
+    finally:
+        await _cancel_tasks(tasks)
+
+    failed = False
+    for task in done:
+        answer = _task_answer(task)
+        if answer is None:
+            failed = True
+        results[tasks[task]] = answer or []
+
+    # A late provider would have changed the list; leave it uncached so the next search asks again.
+    if not pending:
+        _search_cache.set(cache_key, results, _results_ttl(results, failed=failed))
+    return results
+
+
+async def _start_remote_tasks(
+    query: str,
+    limit: int,
+    client: Optional[FatSecretClient],
+    api_key: Optional[str],
+) -> Dict["asyncio.Task", str]:
+    import asyncio
+
+    tasks = {}
+    if await asyncio.to_thread(_needs_remote, query, limit):
+        if client:
+            tasks[asyncio.ensure_future(client.search_foods_async(query, limit))] = "fatsecret"
+        if api_key:
+            tasks[asyncio.ensure_future(_search_usda_async(query, api_key, limit))] = "usda"
+    return tasks
+
+
+async def _cancel_tasks(tasks: Iterable["asyncio.Task"]) -> None:
+    import asyncio
+
+    # Late or abandoned provider calls are cancelled and awaited so none outlives the search.
+    late = [task for task in tasks if not task.done()]
+    for task in late:
+        task.cancel()
+    if late:
+        await asyncio.gather(*late, return_exceptions=True)
+
+
+def _task_answer(task: "asyncio.Task") -> Optional[List[Dict]]:
+    """
+    Foods returned by a finished provider task, or None when the provider failed.
+    """
+    exc = task.exception()
+    if isinstance(exc, (FatSecretError, FoodLookupError)):
+        return None
+    if exc is not None:
+        raise exc
+    return task.result()
+
 
-    if not foods:
-        foods = _search_local(query, limit)
+def _needs_remote(query: str, limit: int) -> bool:
+    # Queries the learned tier already answers stay offline.
+    return bool(query) and _learned_hits(query) < min(limit, LEARNED_SATISFY_HITS)
 
-    return foods
 
+def _split_local(foods: List[Dict]) -> Dict[str, List[Dict]]:
+    """
+    Groups :func:`_search_local` results by tier so each gets its provider weight.
+    """
+    learned_ids = _learned_index().meta
+    results: Dict[str, List[Dict]] = {"custom": [], "learned": [], "local": []}
+    for food in foods:
+        if food.get("source") == "custom":
+            results["custom"].append(food)
+        elif food.get("id") in learned_ids:
+            results["learned"].append(food)
+        else:
+            results["local"].append(food)
+    return results
+
+
+def _merge_results(
+    results: Dict[str, List[Dict]],
+    query: str,
+    limit: int,
+    demote_tags: Optional[Iterable[str]] = None,
+) -> List[Dict]:
+    usage = get_food_usage_scores()
+    return merge_results(
+        results,
+        query,
+        limit,
+        boost=lambda food_id: _usage_boost(usage, food_id),
+        demote_tags=demote_tags,
+        expansions=expand_query(query.lower()),
+    )
+
+
+def _results_ttl(results: Dict[str, List[Dict]], *, failed: bool = False) -> float:
+    # A provider that errored may answer on the next try, so its gap is only cached briefly.
+    if failed:
+        return SEARCH_CACHE_NEGATIVE_TTL
+    # The shortest-lived provider that answered bounds how long the merged list stays valid.
+    return min(
+        (SEARCH_CACHE_TTLS.get(provider, SEARCH_CACHE_NEGATIVE_TTL) for provider, foods in results.items() if foods),
+        default=SEARCH_CACHE_NEGATIVE_TTL,
+    )
+
+
+def _search_cache_key(
+    query: str,
+    limit: int,
+    client: Optional[FatSecretClient],
+    api_key: Optional[str],
+) -> Tuple:
+    providers = tuple(
+        name for name, enabled in (("fatsecret", client is not None), ("usda", bool(api_key))) if enabled
+    )
+    market = (client.default_region, client.default_language) if client else (None, None)
+    # Custom and learned foods are part of the cached local results; usage is applied
+    # after the lookup (see _merge_results), so it stays out of the key.
+    return (
+        " ".join(query.lower().split()),
+        int(limit),
+        providers,
+        market,
+        custom_foods_version(),
+        get_learned_store().version,
+    )
+
+
+def search_foods_fanout(
+    query: str,
+    limit: int = 8,
+    *,
+    budget: float = SEARCH_BUDGET,
+    on_update: Optional[Callable[[List[Dict]], None]] = None,
+    demote_tags: Optional[Iterable[str]] = None,
+    cancelled: Optional[threading.Event] = None,
+) -> List[Dict]:
+    """
+    Queries FatSecret and USDA concurrently while local results are available at once.
+    ``on_update`` receives the merged list after the local pass and after each remote
+    provider answers. Providers still pending when ``budget`` expires are ignored.
+    Results are merged as in :func:`search_foods`; foods tagged with any of
+    ``demote_tags`` rank after every other match. Setting ``cancelled`` (e.g. when a
+    newer search supersedes this one) stops before remote calls are started, drops
+    those still queued and silences ``on_update``; nothing is cached then.
+    """
+    query = (query or "").strip()
+    demote_tags = tuple(sorted(str(tag).lower() for tag in demote_tags or ()))
 
-def search_local_foods(query: str, limit: int = 12, *, tags: Optional[Iterable[str]] = None) -> List[Dict]:
+    client = _get_fatsecret_client()
+    api_key = os.getenv("FOODDATA_API_KEY")
+    # Shares the per-provider cache with search_foods; demoted tags only affect the merge.
+    cache_key = _search_cache_key(query, limit, client, api_key)
+    cached = _search_cache.get(cache_key)
+    if cached is not None:
+        foods = deepcopy(_merge_results(cached, query, limit, demote_tags))
+        if on_update:
+            on_update(foods)
+        return foods
+
+    from concurrent.futures import FIRST_COMPLETED, wait
+
+    def superseded() -> bool:
+        return cancelled is not None and cancelled.is_set()
+
+    deadline = time.monotonic() + budget
+    futures = {}
+    remote = _needs_remote(query, limit) and not superseded()
+    if remote and client:
+        futures[_submit(client.search_foods, query, limit)] = "fatsecret"
+    if remote and api_key:
+        futures[_submit(_search_usda, query, api_key, limit)] = "usda"
+
+    results = _split_local(_search_local(query, limit))
+    merged = _merge_results(results, query, limit, demote_tags)
+    if on_update and not superseded():
+        on_update(deepcopy(merged))
+
+    failed = False
+    pending = set(futures)
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or superseded():
+            break
+        if cancelled is not None:
+            remaining = min(remaining, CANCEL_POLL_INTERVAL)
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                foods = future.result()
+            except (FatSecretError, FoodLookupError):
+                foods = []
+                failed = True
+            if not foods:
+                continue
+            results[futures[future]] = foods
+            merged = _merge_results(results, query, limit, demote_tags)
+            if on_update and not superseded():
+                on_update(deepcopy(merged))
+
+    for future in pending:
+        # Calls not started yet are dropped; running ones finish in the background.
+        future.cancel()
+    if not pending and not superseded():
+        _search_cache.set(cache_key, results, _results_ttl(results, failed=failed))
+    return deepcopy(merged)
+
+
+async def search_foods_fanout_async(
+    query: str,
+    limit: int = 8,
+    *,
+    budget: float = SEARCH_BUDGET,
+    on_update: Optional[Callable[[List[Dict]], None]] = None,
+    demote_tags: Optional[Iterable[str]] = None,
+) -> List[Dict]:
+    """
+    Coroutine version of :func:`search_foods_fanout` on the asyncio FatSecret and USDA
+    clients, so every search shares the event loop and its pooled connections.
+    Cancelling the coroutine cancels the provider calls still in flight.
+    """
+    import asyncio
+
+    query = (query or "").strip()
+    demote_tags = tuple(sorted(str(tag).lower() for tag in demote_tags or ()))
+
+    client = _get_fatsecret_client()
+    api_key = os.getenv("FOODDATA_API_KEY")
+    cache_key = await asyncio.to_thread(_search_cache_key, query, limit, client, api_key)
+    cached = _search_cache.get(cache_key)
+    if cached is not None:
+        foods = deepcopy(await asyncio.to_thread(_merge_results, cached, query, limit, demote_tags))
+        if on_update:
+            on_update(foods)
+        return foods
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + budget
+    tasks = await _start_remote_tasks(query, limit, client, api_key)
+    pending = set(tasks)
+    try:
+        results = _split_local(await asyncio.to_thread(_search_local, query, limit))
+        merged = await asyncio.to_thread(_merge_results, results, query, limit, demote_tags)
+        if on_update:
+            on_update(deepcopy(merged))
+
+        failed = False
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                foods = _task_answer(task)
+                if foods is None:
+                    failed = True
+                if not foods:
+                    continue
+                results[tasks[task]] = foods
+                merged = await asyncio.to_thread(_merge_results, results, query, limit, demote_tags)
+                if on_update:
+                    on_update(deepcopy(merged))
+    finally:
+        await _cancel_tasks(tasks)
+
+    if not pending:
+        _search_cache.set(cache_key, results, _results_ttl(results, failed=failed))
+    return deepcopy(merged)
+
+
+def search_cache_stats() -> Dict[str, float]:
+    return _search_cache.stats()
+
+
+def coalescing_stats() -> Dict[str, Dict[str, float]]:
+    """
+    How many identical concurrent searches and FatSecret requests shared an upstream call.
+    """
+    return {"search": _search_flight.stats(), "fatsecret": FatSecretClient.coalescing_stats()}
+
+
+def clear_search_cache() -> None:
+    _search_cache.clear()
+
+
+def search_local_foods(
+    query: str,
+    limit: int = 12,
+    *,
+    tags: Optional[Iterable[str]] = None,
+    match_all_tags: bool = False,
+    categories: Optional[Iterable[str]] = None,
+) -> List[Dict]:
     """
     Returns items from the bundled local catalogue.
+    Items must carry any of ``tags`` (all of them with ``match_all_tags``) and,
+    when given, belong to one of ``categories``.
     """
-    return _search_local(query, limit, tags=tags)
+    return _search_local(query, limit, tags=tags, match_all_tags=match_all_tags, categories=categories)
+
+
+def list_local_categories() -> List[str]:
+    return _local_index().categories()
 
 
 def scale_macros(food: Dict, grams: float) -> Dict[str, float]:
     """
     Scale the macros of the provided food dictionary to the desired grams.
+    For many foods or portions at once use scale_macros_batch / scale_macros_each.
     """
     portion = food.get("portion", {}) or {}
     base_grams = float(portion.get("grams") or 100)
@@ -102,67 +650,158 @@ def describe_portion(food: Dict) -> str:
     return "porcion estandar"
 
 
-def _search_local(query: str, limit: int, tags: Optional[Iterable[str]] = None) -> List[Dict]:
-    items = _load_local_foods()
-    if not items:
+def _search_local(
+    query: str,
+    limit: int,
+    tags: Optional[Iterable[str]] = None,
+    *,
+    match_all_tags: bool = False,
+    categories: Optional[Iterable[str]] = None,
+) -> List[Dict]:
+    # Every index applies the filters, so one-shot iterables must not be consumed by the first.
+    tags = tuple(tags) if tags else None
+    categories = tuple(categories) if categories else None
+    index = _local_index()
+    learned = _learned_index()
+    custom = _custom_index()
+    mapped = _mapped_catalog()
+    if not len(index) and not len(learned) and not len(custom) and not mapped:
         return []
 
-    query_l = (query or "").lower()
-    tag_filter = {str(tag).lower() for tag in tags} if tags else None
-
-    def score(item: Dict) -> float:
-        name = item.get("name", "").lower()
-        if not query_l:
-            return 1.0
-        if query_l in name:
-            return 0.9 + len(query_l) / max(len(name), 1)
-        name_words = name.split()
-        matches = sum(1 for w in name_words if w.startswith(query_l))
-        return matches / len(name_words) if name_words else 0.0
-
-    def matches_tags(item_id: Optional[str]) -> bool:
-        if not tag_filter:
-            return True
-        meta = ARGENTINA_PRODUCTS_META.get(item_id or "")
-        meta_tags = set(tag.lower() for tag in (meta.get("tags") if meta else []) or [])
-        return bool(meta_tags & tag_filter)
-
-    scored: List[Tuple[float, Dict]] = []
-    for item in items:
-        if not matches_tags(item.get("id")):
-            continue
-        sc = score(item)
-        if query_l and sc <= 0:
-            continue
-        scored.append((sc, item))
-
-    scored.sort(key=lambda pair: pair[0], reverse=True)
-    ranked_items = [item for _, item in scored]
-    return [_normalise_food(item, source="local") for item in ranked_items[:limit]]
-
-
-def _search_usda(query: str, api_key: str, limit: int) -> List[Dict]:
-    params = {
+    query_l = " ".join((query or "").lower().split())
+    usage = get_food_usage_scores()
+    # Synonyms and translations of the query are searched in the same pass, below literal matches.
+    expansions = expand_query(query_l)
+
+    def boost(food_id: Optional[str]) -> float:
+        return _usage_boost(usage, food_id)
+
+    def ranked_positions(catalog: CatalogIndex) -> List[Tuple[float, int]]:
+        allowed = catalog.all_bits
+        if tags:
+            allowed &= catalog.tags_bits(tags, match_all=match_all_tags)
+        if categories:
+            allowed &= catalog.categories_bits(categories)
+        best: Dict[int, float] = {}
+        for term, weight in expansions:
+            for pos in iter_positions(catalog.text_bits(term) & allowed):
+                sc = weight * text_score(term, catalog.names[pos])
+                if term and sc <= 0:
+                    continue
+                if sc > best.get(pos, -1.0):
+                    best[pos] = sc
+        scored = [(sc + boost(catalog.items[pos].get("id")), pos) for pos, sc in best.items()]
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return scored[:limit]
+
+    # Custom and learned foods are already normalised and win ties against the catalogue.
+    ranked: List[Tuple[float, Dict, bool]] = [
+        (sc, custom.items[pos], True) for sc, pos in ranked_positions(custom)
+    ]
+    ranked += [(sc, learned.items[pos], True) for sc, pos in ranked_positions(learned)]
+    ranked += [(sc, index.items[pos], False) for sc, pos in ranked_positions(index)]
+    ranked.sort(key=lambda entry: entry[0], reverse=True)
+    ranked = ranked[:limit]
+
+    if mapped:
+        # A wider candidate pool lets boosted rows overtake closer text matches.
+        mapped_best: Dict[int, float] = {}
+        for term, weight in expansions:
+            for sc, pos in mapped.search(
+                term,
+                limit * 3 if usage else limit,
+                tags=tags,
+                match_all_tags=match_all_tags,
+                categories=categories,
+            ):
+                mapped_best[pos] = max(mapped_best.get(pos, -1.0), weight * sc)
+        mapped_hits = [(sc, pos) for pos, sc in mapped_best.items()]
+        if usage:
+            mapped_hits = [(sc + boost(mapped.food_id(pos)), pos) for sc, pos in mapped_hits]
+        # Only the mapped rows that survive the merge are materialised.
+        merged = sorted(
+            [(sc, None, item, prebuilt) for sc, item, prebuilt in ranked]
+            + [(sc, pos, None, False) for sc, pos in mapped_hits],
+            key=lambda entry: entry[0],
+            reverse=True,
+        )[:limit]
+        ranked = [
+            (sc, item if pos is None else mapped.record(pos), prebuilt)
+            for sc, pos, item, prebuilt in merged
+        ]
+
+    return [
+        deepcopy(item) if prebuilt else _normalise_food(item, source=item.get("source") or "local")
+        for _, item, prebuilt in ranked
+    ]
+
+
+def _usage_boost(usage: Dict[str, float], food_id: Optional[str]) -> float:
+    # Blends the user's logging history into the text score.
+    used = usage.get(food_id or "")
+    return USAGE_BOOST * (1.0 - math.exp(-used / USAGE_BOOST_SCALE)) if used else 0.0
+
+
+def _usda_params(query: str, api_key: str, limit: int) -> Dict[str, str]:
+    return {
         "api_key": api_key,
         "query": query,
         "pageSize": str(limit),
         "requireAllWords": "false",
         "dataType": "SR Legacy,Survey (FNDDS),Branded",
     }
+
+
+def _search_usda(query: str, api_key: str, limit: int) -> List[Dict]:
+    from services.http_cache import cached_request
+
+    params = _usda_params(query, api_key, limit)
     url = f"{USDA_API_URL}?{urllib.parse.urlencode(params)}"
 
-    req = urllib.request.Request(url, headers={"Accept": "application/json"})
-    ctx = ssl.create_default_context()
+    def fetch() -> Dict:
+        health = get_provider_health("usda")
+        if not health.allow():
+            raise FoodLookupError("USDA no responde; se omite temporalmente.")
+        try:
+            with health.track():
+                return get_transport().request(
+                    "GET", url, headers={"Accept": "application/json"}, timeout=health.timeout()
+                ).json()
+        except Exception as exc:
+            raise FoodLookupError(str(exc)) from exc
 
-    try:
-        with urllib.request.urlopen(req, timeout=6, context=ctx) as resp:
-            data = json.loads(resp.read().decode("utf-8"))
-    except Exception as exc:
-        raise FoodLookupError(str(exc)) from exc
+    data = cached_request("usda", params, fetch, ttl=USDA_RESPONSE_TTL)
+    return _parse_usda_foods(data, limit)
 
+
+async def _search_usda_async(query: str, api_key: str, limit: int) -> List[Dict]:
+    from services.async_http import get_async_transport
+    from services.http_cache import cached_request_async
+
+    params = _usda_params(query, api_key, limit)
+    url = f"{USDA_API_URL}?{urllib.parse.urlencode(params)}"
+
+    async def fetch() -> Dict:
+        health = get_provider_health("usda")
+        if not health.allow():
+            raise FoodLookupError("USDA no responde; se omite temporalmente.")
+        try:
+            with health.track():
+                response = await get_async_transport().request(
+                    "GET", url, headers={"Accept": "application/json"}, timeout=health.timeout()
+                )
+                return response.json()
+        except Exception as exc:
+            raise FoodLookupError(str(exc)) from exc
+
+    data = await cached_request_async("usda", params, fetch, ttl=USDA_RESPONSE_TTL)
+    return _parse_usda_foods(data, limit)
+
+
+def _parse_usda_foods(data: Dict, limit: int) -> List[Dict]:
     foods = []
     for item in data.get("foods", []):
-        macros = _extract_usda_macros(item.get("foodNutrients", []))
+        macros = extract_usda_macros(item.get("foodNutrients", []))
         if not macros:
             continue
         foods.append(
@@ -180,34 +819,6 @@ def _search_usda(query: str, api_key: str, limit: int) -> List[Dict]:
     return foods[:limit]
 
 
-def _extract_usda_macros(nutrients: List[Dict]) -> Optional[Dict[str, float]]:
-    if not nutrients:
-        return None
-
-    macros: Dict[str, float] = {"kcal": 0.0, "p": 0.0, "c": 0.0, "g": 0.0}
-    for nutrient in nutrients:
-        name = nutrient.get("nutrientName")
-        unit = nutrient.get("unitName")
-        if name not in NUTRIENT_MAP:
-            continue
-        key = NUTRIENT_MAP[name]
-        value = nutrient.get("value")
-        if value is None:
-            continue
-        if key == "kcal" and unit != "kcal":
-            continue
-        macros[key] = float(value)
-
-    if macros["kcal"] == 0.0 and any(macros[k] for k in ("p", "c", "g")):
-        macros["kcal"] = round(
-            macros["p"] * 4 + macros["c"] * 4 + macros["g"] * 9, 0
-        )
-
-    if not any(macros.values()):
-        return None
-    return macros
-
-
 def _normalise_food(item: Dict, source: str) -> Dict:
     portion = item.get("portion", {}) or {}
     grams = portion.get("grams") or 100
@@ -237,9 +848,12 @@ def _normalise_food(item: Dict, source: str) -> Dict:
     category = item.get("category")
     if category:
         normalised["category"] = str(category)
+    barcode = item.get("barcode")
+    if barcode:
+        normalised["barcode"] = str(barcode)
 
     if source == "local":
-        meta = ARGENTINA_PRODUCTS_META.get(normalised["id"])
+        meta = _local_index().meta.get(normalised["id"])
         if meta:
             meta_brand = meta.get("brand")
             if meta_brand and not normalised.get("brand"):
@@ -247,6 +861,9 @@ def _normalise_food(item: Dict, source: str) -> Dict:
             meta_category = meta.get("category")
             if meta_category and not normalised.get("category"):
                 normalised["category"] = meta_category
+            meta_barcode = meta.get("barcode")
+            if meta_barcode and not normalised.get("barcode"):
+                normalised["barcode"] = str(meta_barcode)
             meta_tags = meta.get("tags") or []
             existing = list(normalised.get("tags", []))
             merged = existing + [tag for tag in meta_tags if tag not in existing]
@@ -256,39 +873,56 @@ def _normalise_food(item: Dict, source: str) -> Dict:
 
 
 _cached_client: Optional[FatSecretClient] = None
-_cached_client_config: Optional[Tuple[str, str, Optional[str], Optional[str]]] = None
+_cached_client_config: Optional[Tuple[str, str, Optional[str], Optional[str], int]] = None
 
 
 def _get_fatsecret_client() -> Optional[FatSecretClient]:
-    global _cached_client, _cached_client_config
-
     key = os.getenv("FATSECRET_CONSUMER_KEY")
     secret = os.getenv("FATSECRET_CONSUMER_SECRET")
     if not key or not secret:
-        _cached_client = None
-        _cached_client_config = None
+        _replace_client(None)
         return None
 
     region = os.getenv("FATSECRET_REGION") or "AR"
     language = os.getenv("FATSECRET_LANGUAGE") or "es"
-    config: Tuple[str, str, Optional[str], Optional[str]] = (key, secret, region, language)
+    max_concurrency = _env_int("FATSECRET_MAX_CONCURRENCY", 4)
+    config: Tuple[str, str, Optional[str], Optional[str], int] = (key, secret, region, language, max_concurrency)
 
     if _cached_client is None or _cached_client_config != config:
         try:
-            _cached_client = FatSecretClient(
+            client = FatSecretClient(
                 key,
                 secret,
                 default_region=region,
                 default_language=language,
+                max_concurrency=max_concurrency,
             )
-            _cached_client_config = config
         except ValueError:
-            _cached_client = None
-            _cached_client_config = None
+            client = None
+        _replace_client(client, config if client else None)
 
     return _cached_client
 
 
+def _replace_client(
+    client: Optional[FatSecretClient],
+    config: Optional[Tuple[str, str, Optional[str], Optional[str], int]] = None,
+) -> None:
+    global _cached_client, _cached_client_config
+    previous = _cached_client
+    _cached_client = client
+    _cached_client_config = config
+    if previous is not None and previous is not client:
+        previous.close()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name) or default)
+    except ValueError:
+        return default
+
+
 def format_macros(macros: Dict[str, float]) -> str:
     kcal = macros.get("kcal", 0)
     return f"{kcal:.0f} kcal  P {macros.get('p', 0):.1f}g  C {macros.get('c', 0):.1f}g  G {macros.get('g', 0):.1f}g"
@@ -0,0 +1,172 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional
+
+from services.http_transport import HttpStatusError
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def is_provider_failure(exc: BaseException) -> bool:
+    """
+    Client errors (4xx other than 429) mean the provider answered, so they do not trip the breaker.
+    Wrapped errors are judged by their cause; an exception may also set ``provider_failure``
+    itself, e.g. for an error payload returned with HTTP 200.
+    """
+    flag = getattr(exc, "provider_failure", None)
+    if flag is not None:
+        return bool(flag)
+    cause: Optional[BaseException] = exc
+    while cause is not None:
+        if isinstance(cause, HttpStatusError):
+            return cause.code >= 500 or cause.code == 429
+        cause = cause.__cause__
+    return True
+
+
+class ProviderHealth:
+    """
+    Circuit breaker plus latency tracker for one remote provider.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and calls are
+    rejected immediately. Once ``reset_timeout`` has passed a single probe call is let
+    through (half-open); its outcome closes or re-opens the circuit. ``timeout()``
+    derives the request timeout from the observed p95 latency.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+        min_timeout: float = 1.5,
+        max_timeout: float = 6.0,
+        latency_window: int = 50,
+        timeout_factor: float = 2.0,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_factor = timeout_factor
+        self.state = CLOSED
+        self._latencies: Deque[float] = deque(maxlen=latency_window)
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+            self.state = CLOSED
+            self.successes += 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def cancel(self) -> None:
+        """
+        Gives back a half-open probe that was granted by :meth:`allow` but never sent.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        """
+        Records the latency of the wrapped call, or a failure when it raises one.
+        """
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as exc:
+            if is_provider_failure(exc):
+                self.record_failure()
+            else:
+                self.record_success(time.monotonic() - started)
+            raise
+        except BaseException:
+            # Cancelled by the caller (search budget expired): says nothing about the provider.
+            self.cancel()
+            raise
+        self.record_success(time.monotonic() - started)
+
+    def p95(self) -> float:
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+
+    def timeout(self) -> float:
+        if len(self._latencies) < 5:
+            return self.max_timeout
+        return max(self.min_timeout, min(self.max_timeout, self.p95() * self.timeout_factor))
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "state": self.state,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "p95": self.p95(),
+            "timeout": self.timeout(),
+        }
+
+
+_registry: Dict[str, ProviderHealth] = {}
+_registry_lock = threading.Lock()
+
+
+def get_provider_health(name: str, *, max_timeout: Optional[float] = None) -> ProviderHealth:
+    """
+    Shared tracker for ``name``. A given ``max_timeout`` replaces the current one, so a
+    client rebuilt with a new timeout is not stuck with the first client's value.
+    """
+    with _registry_lock:
+        health = _registry.get(name)
+        if health is None:
+            health = ProviderHealth(name) if max_timeout is None else ProviderHealth(name, max_timeout=max_timeout)
+            _registry[name] = health
+        elif max_timeout is not None and health.max_timeout != max_timeout:
+            with health._lock:
+                health.max_timeout = max_timeout
+        return health
+
+
+def provider_health_stats() -> Dict[str, Dict[str, float]]:
+    with _registry_lock:
+        providers = list(_registry.values())
+    return {health.name: health.snapshot() for health in providers}
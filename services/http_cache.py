@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent.parent / "data" / "http_cache.sqlite3"
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_STALE = 7 * 24 * 60 * 60  # how long expired entries may still serve stale-if-error
+
+# Request parameters that never change the response (OAuth 1.0 signing noise, credentials).
+_VOLATILE_PREFIXES = ("oauth_",)
+_VOLATILE_PARAMS = {"api_key"}
+
+
+def canonical_key(namespace: str, params: Dict[str, str], *, exclude: Iterable[str] = ()) -> str:
+    skip = set(_VOLATILE_PARAMS) | set(exclude)
+    stable = sorted(
+        (str(k), str(v))
+        for k, v in params.items()
+        if k not in skip and not str(k).startswith(_VOLATILE_PREFIXES)
+    )
+    raw = json.dumps([namespace, stable], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache of decoded JSON API responses.
+    Entries carry a TTL; expired entries are kept for ``max_stale`` seconds so they
+    can still be served when the upstream call fails. Least recently used entries
+    are evicted once ``max_entries`` is exceeded. Storage errors disable caching
+    instead of failing the lookup.
+    """
+
+    def __init__(
+        self,
+        path: Path = DEFAULT_CACHE_PATH,
+        *,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_stale: float = DEFAULT_MAX_STALE,
+    ):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_stale = max_stale
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disabled = False
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self._disabled:
+            return None
+        if self._conn is None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(str(self.path), timeout=2.0, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS responses (
+                        key TEXT PRIMARY KEY,
+                        namespace TEXT NOT NULL,
+                        body TEXT NOT NULL,
+                        stored_at REAL NOT NULL,
+                        expires_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )
+                    """
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+                conn.commit()
+                self._conn = conn
+            except sqlite3.Error:
+                self._disabled = True
+                return None
+        return self._conn
+
+    def get(self, key: str, *, allow_stale: bool = False) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute(
+                    "SELECT body, expires_at FROM responses WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                body, expires_at = row
+                fresh = expires_at > now
+                if not fresh and (not allow_stale or now - expires_at > self.max_stale):
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+            except sqlite3.Error:
+                return None
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+        try:
+            return json.loads(body)
+        except json.JSONDecodeError:
+            return None
+
+    def set(self, key: str, namespace: str, payload: Dict, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        now = time.time()
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, namespace, body, stored_at, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, namespace, body, now, now + ttl, now),
+                )
+                self._evict(conn, now)
+                conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM responses WHERE expires_at < ?", (now - self.max_stale,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return
+            try:
+                if namespace:
+                    conn.execute("DELETE FROM responses WHERE namespace = ?", (namespace,))
+                else:
+                    conn.execute("DELETE FROM responses")
+                conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": ((self.hits + self.stale_hits) / lookups) if lookups else 0.0,
+        }
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    Shared cache instance; MACROENTRENO_HTTP_CACHE=0 disables it and
+    MACROENTRENO_HTTP_CACHE_PATH moves the database.
+    """
+    global _cache
+    if os.getenv("MACROENTRENO_HTTP_CACHE", "1").strip().lower() in {"0", "false", "no", "off"}:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            path = os.getenv("MACROENTRENO_HTTP_CACHE_PATH")
+            _cache = ResponseCache(Path(path) if path else DEFAULT_CACHE_PATH)
+        return _cache
+
+
+def cached_request(
+    namespace: str,
+    params: Dict[str, str],
+    fetch: Callable[[], Dict],
+    *,
+    ttl: float,
+    stale_if_error: bool = True,
+) -> Dict:
+    """
+    Returns the cached response for ``params`` or calls ``fetch`` and stores its result.
+    When ``fetch`` raises and ``stale_if_error`` is set, an expired entry is served instead.
+    """
+    cache = get_response_cache()
+    if cache is None or ttl <= 0:
+        return fetch()
+
+    key = canonical_key(namespace, params)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        payload = fetch()
+    except Exception:
+        if stale_if_error:
+            stale = cache.get(key, allow_stale=True)
+            if stale is not None:
+                return stale
+        raise
+
+    cache.set(key, namespace, payload, ttl)
+    return payload
+
+
+async def cached_request_async(
+    namespace: str,
+    params: Dict[str, str],
+    fetch: Callable[[], Awaitable[Dict]],
+    *,
+    ttl: float,
+    stale_if_error: bool = True,
+) -> Dict:
+    """
+    Coroutine counterpart of :func:`cached_request`; ``fetch`` returns an awaitable.
+    SQLite reads and writes run in a worker thread so the event loop never blocks on disk.
+    """
+    import asyncio
+
+    if ttl <= 0:
+        return await fetch()
+    cache = await asyncio.to_thread(get_response_cache)
+    if cache is None:
+        return await fetch()
+
+    key = canonical_key(namespace, params)
+    cached = await asyncio.to_thread(cache.get, key)
+    if cached is not None:
+        return cached
+
+    try:
+        payload = await fetch()
+    except Exception:
+        if stale_if_error:
+            stale = await asyncio.to_thread(cache.get, key, allow_stale=True)
+            if stale is not None:
+                return stale
+        raise
+
+    await asyncio.to_thread(cache.set, key, namespace, payload, ttl)
+    return payload
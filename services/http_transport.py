@@ -0,0 +1,214 @@
+import gzip
+import http.client
+import json
+import ssl
+import threading
+import time
+import urllib.parse
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+
+DEFAULT_TIMEOUT = 6.0
+# Failures that mean a pooled keep-alive socket was closed by the server in the meantime.
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+_HostKey = Tuple[str, str, int]
+
+
+@lru_cache(maxsize=None)
+def ssl_context() -> ssl.SSLContext:
+    """
+    Client TLS context shared by both transports, built on first use: loading the CA
+    bundle takes tens of milliseconds that importing the module should not pay.
+    """
+    return ssl.create_default_context()
+
+
+class HttpTransportError(Exception):
+    """Raised when the request could not be completed."""
+
+
+class HttpStatusError(HttpTransportError):
+    """Raised for HTTP error responses (status >= 400)."""
+
+    def __init__(self, code: int, body: bytes):
+        self.code = code
+        self.body = body
+        super().__init__(f"HTTP {code}")
+
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="ignore")
+
+
+class HttpResponse:
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def text(self) -> str:
+        return self.body.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.text())
+
+
+class HttpTransport:
+    """
+    Keeps persistent (keep-alive) connections per host and reuses one SSL context,
+    so repeated calls to the same API skip the TCP and TLS handshakes.
+    Connections are checked out by one request at a time, so the transport is thread-safe.
+    """
+
+    def __init__(self, *, max_idle_per_host: int = 8, idle_timeout: float = 60.0):
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self._idle: Dict[_HostKey, List[Tuple[http.client.HTTPConnection, float]]] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        headers: Optional[Dict[str, str]] = None,
+        body: Optional[bytes] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> HttpResponse:
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme or "https"
+        port = parts.port or (443 if scheme == "https" else 80)
+        host_key: _HostKey = (scheme, parts.hostname or "", port)
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+
+        request_headers = {"Accept-Encoding": "gzip", "Connection": "keep-alive"}
+        request_headers.update(headers or {})
+
+        with self._lock:
+            self.requests += 1
+
+        conn, reused = self._checkout(host_key, timeout)
+        try:
+            response = self._send(conn, method, path, request_headers, body, timeout)
+        except _STALE_CONNECTION_ERRORS as exc:
+            conn.close()
+            if not reused:
+                raise HttpTransportError(str(exc)) from exc
+            # The pooled socket went away; retry once on a fresh connection.
+            conn, _ = self._checkout(host_key, timeout, fresh=True)
+            try:
+                response = self._send(conn, method, path, request_headers, body, timeout)
+            except (OSError, http.client.HTTPException) as retry_exc:
+                conn.close()
+                raise HttpTransportError(str(retry_exc)) from retry_exc
+        except (OSError, http.client.HTTPException) as exc:
+            conn.close()
+            raise HttpTransportError(str(exc)) from exc
+
+        status, response_headers, payload, keep_alive = response
+        if keep_alive:
+            self._checkin(host_key, conn)
+        else:
+            conn.close()
+
+        if status >= 400:
+            raise HttpStatusError(status, payload)
+        return HttpResponse(status, response_headers, payload)
+
+    def _send(
+        self,
+        conn: http.client.HTTPConnection,
+        method: str,
+        path: str,
+        headers: Dict[str, str],
+        body: Optional[bytes],
+        timeout: float,
+    ) -> Tuple[int, Dict[str, str], bytes, bool]:
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        conn.request(method, path, body=body, headers=headers)
+        resp = conn.getresponse()
+        payload = resp.read()
+        response_headers = {k.lower(): v for k, v in resp.getheaders()}
+        if response_headers.get("content-encoding", "").lower() == "gzip":
+            payload = gzip.decompress(payload)
+        return resp.status, response_headers, payload, not resp.will_close
+
+    def _checkout(self, host_key: _HostKey, timeout: float, *, fresh: bool = False) -> Tuple[http.client.HTTPConnection, bool]:
+        if not fresh:
+            now = time.monotonic()
+            with self._lock:
+                idle = self._idle.get(host_key) or []
+                while idle:
+                    conn, last_used = idle.pop()
+                    if now - last_used < self.idle_timeout and conn.sock is not None:
+                        self.connections_reused += 1
+                        return conn, True
+                    conn.close()
+
+        scheme, host, port = host_key
+        if scheme == "https":
+            conn: http.client.HTTPConnection = http.client.HTTPSConnection(
+                host, port, timeout=timeout, context=ssl_context()
+            )
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        with self._lock:
+            self.connections_opened += 1
+        return conn, False
+
+    def _checkin(self, host_key: _HostKey, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(host_key, [])
+            if len(idle) >= self.max_idle_per_host:
+                conn.close()
+                return
+            idle.append((conn, time.monotonic()))
+
+    def close(self) -> None:
+        with self._lock:
+            pools = list(self._idle.values())
+            self._idle.clear()
+        for idle in pools:
+            for conn, _ in idle:
+                conn.close()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            idle = sum(len(pool) for pool in self._idle.values())
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "connections_reused": self.connections_reused,
+                "reuse_rate": (self.connections_reused / self.requests) if self.requests else 0.0,
+                "idle_connections": idle,
+            }
+
+
+_transport: Optional[HttpTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HttpTransport:
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = HttpTransport()
+        return _transport
+
+
+def transport_stats() -> Dict[str, float]:
+    return get_transport().stats()
@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+import time
+from copy import deepcopy
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from services.file_lock import FileLock, lock_path_for
+
+
+DEFAULT_LEARNED_PATH = Path(__file__).resolve().parent.parent / "data" / "learned_foods.json"
+DEFAULT_MAX_FOODS = 1000
+# Sources whose foods are worth keeping locally; local and custom foods already are.
+LEARNABLE_SOURCES = {"fatsecret", "usda"}
+
+
+class LearnedFoodStore:
+    """
+    Remote foods the user logged, kept with their full servings so later searches can
+    be answered without the network. Bounded to ``max_foods``: when full, the food
+    logged least often (oldest first on ties) is evicted. Persisted as JSON; like the
+    barcode store, saves merge into the current file under a cross-process lock and
+    reads reload it when its mtime changes.
+    """
+
+    def __init__(self, path: Path = DEFAULT_LEARNED_PATH, *, max_foods: int = DEFAULT_MAX_FOODS):
+        self.path = Path(path)
+        self.max_foods = max(1, int(max_foods))
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(lock_path_for(self.path))
+        self._entries: Dict[str, Dict] = {}
+        self._mtime: Optional[int] = None
+        # Counts this process's changes, which stay in memory if the file cannot be written.
+        self._changes = 0
+        with self._lock:
+            self._refresh_locked()
+
+    @property
+    def version(self) -> Tuple[Optional[int], int]:
+        """
+        Changes whenever any process saves the store, so callers can tell when to rebuild
+        their indexes.
+        """
+        with self._lock:
+            self._refresh_locked()
+            return self._mtime, self._changes
+
+    def _file_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _read_file(self) -> Dict[str, Dict]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        entries: Dict[str, Dict] = {}
+        for entry in data.get("foods") or []:
+            food = entry.get("food") or {}
+            if food.get("id"):
+                entries[food["id"]] = entry
+        return entries
+
+    def _refresh_locked(self) -> None:
+        mtime = self._file_mtime()
+        if mtime is not None and mtime != self._mtime:
+            self._entries = self._read_file()
+            self._mtime = mtime
+
+    def promote(self, food: Dict) -> bool:
+        """
+        Stores or refreshes ``food``; returns False for foods that are not learnable.
+        """
+        source = (food.get("source") or "").lower()
+        food_id = food.get("id")
+        if source not in LEARNABLE_SOURCES or not food_id or not food.get("macros"):
+            return False
+        with self._lock, self._file_lock.locked():
+            # Re-read under the file lock so foods learned by another process survive.
+            self._refresh_locked()
+            entry = self._entries.get(food_id)
+            hits = (entry or {}).get("hits", 0) + 1
+            self._entries[food_id] = {"food": deepcopy(food), "hits": hits, "last_used": time.time()}
+            while len(self._entries) > self.max_foods:
+                victim = min(
+                    (key for key in self._entries if key != food_id),
+                    key=lambda key: (self._entries[key]["hits"], self._entries[key]["last_used"]),
+                )
+                del self._entries[victim]
+            self._changes += 1
+            self._save_locked()
+        return True
+
+    def foods(self) -> List[Dict]:
+        """
+        Learned foods, most logged first. The returned dicts are shared; copy before mutating.
+        """
+        with self._lock:
+            self._refresh_locked()
+            entries = sorted(self._entries.values(), key=lambda entry: (-entry["hits"], -entry["last_used"]))
+            return [entry["food"] for entry in entries]
+
+    def get(self, food_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._refresh_locked()
+            entry = self._entries.get(food_id)
+            return deepcopy(entry["food"]) if entry else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh_locked()
+            return len(self._entries)
+
+    def _save_locked(self) -> None:
+        payload = {"foods": list(self._entries.values())}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+        except OSError:
+            return
+        self._mtime = self._file_mtime()
+
+
+_store: Optional[LearnedFoodStore] = None
+_store_lock = threading.Lock()
+
+
+def get_learned_store() -> LearnedFoodStore:
+    """
+    Shared store; MACROENTRENO_LEARNED_PATH moves the file.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            path = os.getenv("MACROENTRENO_LEARNED_PATH")
+            _store = LearnedFoodStore(Path(path) if path else DEFAULT_LEARNED_PATH)
+        return _store
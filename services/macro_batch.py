@@ -0,0 +1,154 @@
+import math
+import time
+from typing import Dict, List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+
+MACRO_KEYS = ("kcal", "p", "c", "g")
+# Decimals per column, as in scale_macros: kcal to units, macros to one decimal.
+_DECIMALS = (0, 1, 1, 1)
+
+
+def macro_matrix(foods: Sequence[Dict]) -> Tuple[List[List[float]], List[float]]:
+    """
+    Per-portion macro rows (kcal, p, c, g) and portion grams of ``foods``,
+    with the same defaults as :func:`services.foods.scale_macros`.
+    """
+    values: List[List[float]] = []
+    base_grams: List[float] = []
+    for food in foods:
+        macros = food.get("macros", {}) or {}
+        values.append([float(macros.get(key, 0.0)) for key in MACRO_KEYS])
+        grams = float((food.get("portion", {}) or {}).get("grams") or 100)
+        base_grams.append(grams if grams > 0 else 100.0)
+    return values, base_grams
+
+
+def scale_macro_matrix(values, base_grams, grams):
+    """
+    Scales N macro rows to M gram amounts: returns an (N, M, 4) array (nested lists
+    without NumPy) rounded like ``scale_macros``. Raises ValueError when ``values`` and
+    ``base_grams`` differ in length.
+    """
+    _check_lengths(values, base_grams, "values", "base_grams")
+    if np is None:
+        return [
+            [_scale_row(row, base, amount) for amount in grams]
+            for row, base in zip(values, base_grams)
+        ]
+    values = np.asarray(values, dtype=float).reshape(-1, len(MACRO_KEYS))
+    base = np.asarray(base_grams, dtype=float).reshape(-1, 1)
+    amounts = np.asarray(grams, dtype=float).reshape(1, -1)
+    ratios = np.maximum(amounts / base, 0.0)
+    scaled = values[:, None, :] * ratios[:, :, None]
+    return _round_like_python(scaled)
+
+
+def _check_lengths(first: Sequence, second: Sequence, first_name: str, second_name: str) -> None:
+    # Both backends check up front: zip() would silently truncate and NumPy would broadcast.
+    if len(first) != len(second):
+        raise ValueError(f"{first_name} and {second_name} differ in length ({len(first)} != {len(second)}).")
+
+
+def _scale_row(row: Sequence[float], base: float, amount: float) -> List[float]:
+    ratio = max(float(amount) / base, 0.0)
+    return [round(value * ratio, decimals) for value, decimals in zip(row, _DECIMALS)]
+
+
+def _round_like_python(scaled):
+    """
+    Rounds kcal to units and macros to one decimal exactly as ``round()`` would.
+    np.round scales by 10 before rounding, which can flip rare near-half values,
+    so those few cells are re-rounded in Python.
+    """
+    out = np.empty_like(scaled)
+    out[..., 0] = np.round(scaled[..., 0])
+    macros = scaled[..., 1:]
+    tens = macros * 10.0
+    out[..., 1:] = np.round(tens) / 10.0
+    near_half = np.abs(tens - np.floor(tens) - 0.5) < 1e-6
+    if near_half.any():
+        fix = out[..., 1:]
+        fix[near_half] = [round(float(value), 1) for value in macros[near_half]]
+    return out
+
+
+def scale_macros_batch(foods: Sequence[Dict], grams: Sequence[float]) -> List[List[Dict[str, float]]]:
+    """
+    Every food scaled to every gram amount: ``result[i][j]`` equals
+    ``scale_macros(foods[i], grams[j])``.
+    """
+    values, base_grams = macro_matrix(foods)
+    scaled = scale_macro_matrix(values, base_grams, grams)
+    if np is not None:
+        scaled = scaled.tolist()
+    return [[dict(zip(MACRO_KEYS, cell)) for cell in row] for row in scaled]
+
+
+def scale_macros_each(foods: Sequence[Dict], grams: Sequence[float]) -> List[Dict[str, float]]:
+    """
+    ``foods[i]`` scaled to ``grams[i]``, e.g. each custom food to its own portion.
+    Raises ValueError when ``foods`` and ``grams`` differ in length.
+    """
+    _check_lengths(foods, grams, "foods", "grams")
+    values, base_grams = macro_matrix(foods)
+    if np is None:
+        return [
+            dict(zip(MACRO_KEYS, _scale_row(row, base, amount)))
+            for row, base, amount in zip(values, base_grams, grams)
+        ]
+    if not values:
+        return []
+    values_arr = np.asarray(values, dtype=float)
+    ratios = np.maximum(np.asarray(grams, dtype=float) / np.asarray(base_grams, dtype=float), 0.0)
+    scaled = _round_like_python((values_arr * ratios[:, None])[:, None, :])[:, 0, :]
+    return [dict(zip(MACRO_KEYS, row)) for row in scaled.tolist()]
+
+
+def _benchmark(n_foods: int = 10_000, portions: Sequence[float] = (50, 100, 150, 200, 250)) -> None:
+    from services.foods import scale_macros
+
+    foods = [
+        {
+            "portion": {"grams": 50 + (i % 7) * 25},
+            "macros": {"kcal": 80 + i % 400, "p": (i % 37) * 0.7, "c": (i % 53) * 1.1, "g": (i % 29) * 0.45},
+        }
+        for i in range(n_foods)
+    ]
+
+    started = time.perf_counter()
+    scalar = [[scale_macros(food, amount) for amount in portions] for food in foods]
+    scalar_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    values, base_grams = macro_matrix(foods)
+    matrix_prep = time.perf_counter() - started
+    started = time.perf_counter()
+    scale_macro_matrix(values, base_grams, portions)
+    matrix_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = scale_macros_batch(foods, portions)
+    batch_time = time.perf_counter() - started
+
+    mismatches = sum(
+        1
+        for row_a, row_b in zip(scalar, batch)
+        for a, b in zip(row_a, row_b)
+        if any(not math.isclose(a[key], b[key], abs_tol=0.0) for key in MACRO_KEYS)
+    )
+    backend = "numpy" if np is not None else "python"
+    cells = n_foods * len(portions)
+    print(f"{n_foods} alimentos x {len(portions)} porciones ({cells} celdas), backend={backend}")
+    print(f"  scale_macros en bucle:    {scalar_time * 1000:8.1f} ms")
+    print(f"  scale_macro_matrix:       {matrix_time * 1000:8.1f} ms (+{matrix_prep * 1000:.1f} ms armando la matriz)")
+    print(f"  scale_macros_batch:       {batch_time * 1000:8.1f} ms (con dicts de salida)")
+    print(f"  diferencias vs escalar:   {mismatches}")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -1,17 +1,29 @@
 import base64
 import json
 import os
+import threading
 import time
-import urllib.error
 import urllib.parse
-import urllib.request
-from typing import Dict, List, Optional, Tuple, Union
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from services.fatsecret import is_provider_error
+from services.health import get_provider_health
+from services.http_cache import cached_request
+from services.http_transport import HttpStatusError, get_transport
+from services.rate_limit import BACKGROUND, TokenBucket, get_daily_quota, request_lane
+from services.singleflight import SingleFlight
+from services.token_store import get_token_store, token_key
 
 
 TOKEN_URL = "https://oauth.fatsecret.com/connect/token"
 API_URL = "https://platform.fatsecret.com/rest/server.api"
 DEFAULT_SCOPE = "premier"
 DEFAULT_METHOD = "platform.availableLocales.get"
+RESPONSE_CACHE_TTL = 24 * 60 * 60
+LOCALES_CACHE_PATH = Path(__file__).resolve().parent.parent / "data" / "platform_locales.json"
+# Tokens closer than this to expiry are still used while a background refresh replaces them.
+TOKEN_REFRESH_AHEAD = 5 * 60
 
 
 class PlatformLocationError(Exception):
@@ -21,6 +33,15 @@ class PlatformLocationError(Exception):
 class PlatformLocationConfigError(PlatformLocationError):
     """Raised when the Platform client is not properly configured."""
 
+    # Config and quota errors never reach the provider, so they say nothing about its health.
+    provider_failure = False
+
+
+class PlatformLocationQuotaError(PlatformLocationError):
+    """Raised when the local rate limiter or the daily quota refuses a call."""
+
+    provider_failure = False
+
 
 class FatSecretPlatformClient:
     def __init__(
@@ -31,6 +52,8 @@ class FatSecretPlatformClient:
         scope: Optional[str] = None,
         timeout: float = 6.0,
         method: Optional[str] = None,
+        rate_limit: float = 2.0,
+        daily_quota: int = 5000,
     ):
         if not client_id or not client_secret:
             raise PlatformLocationConfigError("Client ID and secret are required for Platform API access.")
@@ -42,6 +65,13 @@ class FatSecretPlatformClient:
 
         self._access_token: Optional[str] = None
         self._token_expiry: float = 0.0
+        self._token_key = token_key(client_id, self.scope)
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self._refresh_timer: Optional[threading.Timer] = None
+        self.health = get_provider_health("fatsecret-platform", max_timeout=timeout)
+        self._bucket = TokenBucket(rate_limit, capacity=2 * rate_limit)
+        self.daily_quota = int(daily_quota)
 
     def list_locales(
         self,
@@ -54,6 +84,16 @@ class FatSecretPlatformClient:
         Returns a list of locales supported by the FatSecret Platform.
         The structure mirrors the API response; this method normalises common variants into a list of dicts.
         """
+        params = self._locale_params(include_measurement_system, region, language)
+        payload = self._request(params)
+        return _normalise_locales_payload(payload)
+
+    def _locale_params(
+        self,
+        include_measurement_system: bool,
+        region: Optional[str],
+        language: Optional[str],
+    ) -> Dict[str, str]:
         params = {
             "method": self.method,
             "format": "json",
@@ -64,49 +104,117 @@ class FatSecretPlatformClient:
             params["language"] = language
         if include_measurement_system:
             params["include_measurement_system"] = "true"
-
-        payload = self._request(params)
-        return _normalise_locales_payload(payload)
+        return params
 
     def _request(self, params: Dict[str, str]) -> Dict:
-        token = self._ensure_token()
-        query_string = urllib.parse.urlencode(params)
-        url = f"{API_URL}?{query_string}"
-
-        req = urllib.request.Request(url)
-        req.add_header("Authorization", f"Bearer {token}")
-        req.add_header("Accept", "application/json")
+        return cached_request("fatsecret-platform", params, lambda: self._send(params), ttl=RESPONSE_CACHE_TTL)
 
+    def _send(self, params: Dict[str, str]) -> Dict:
+        # The breaker goes first so an open circuit does not wait on a token fetch, and the
+        # fetch runs inside track() so a failing token endpoint opens the circuit too.
+        self._check_circuit()
+        try:
+            self._throttle()
+        except BaseException:
+            self.health.cancel()
+            raise
         try:
-            with urllib.request.urlopen(req, timeout=self.timeout) as response:
-                data = response.read().decode("utf-8")
-        except urllib.error.HTTPError as exc:
-            message = exc.read().decode("utf-8", errors="ignore")
-            raise PlatformLocationError(f"HTTP {exc.code}: {message}") from exc
+            with self.health.track():
+                token = self._ensure_token()
+                data = get_transport().request(
+                    "GET", _api_url(params), headers=_api_headers(token), timeout=self.health.timeout()
+                ).text()
+                return _parse_api_payload(data)
+        except PlatformLocationError:
+            raise
+        except HttpStatusError as exc:
+            raise PlatformLocationError(f"HTTP {exc.code}: {exc.text()}") from exc
         except Exception as exc:
             raise PlatformLocationError(str(exc)) from exc
 
-        try:
-            payload = json.loads(data)
-        except json.JSONDecodeError as exc:
-            raise PlatformLocationError("Invalid JSON payload from Platform API.") from exc
-
-        if isinstance(payload, dict) and "error" in payload:
-            error = payload["error"]
-            if isinstance(error, dict):
-                message = error.get("message") or error.get("code") or "Unknown error"
-            else:
-                message = str(error)
-            raise PlatformLocationError(message)
-        return payload
+    def _check_circuit(self) -> None:
+        if not self.health.allow():
+            raise PlatformLocationError("FatSecret Platform no responde; se omite temporalmente.")
+
+    def _throttle(self) -> None:
+        if not self._bucket.acquire(timeout=self.timeout):
+            raise PlatformLocationQuotaError("FatSecret Platform: límite de llamadas por segundo alcanzado.")
+        self._consume_quota()
+
+    def _consume_quota(self) -> None:
+        # Once the day's budget is spent, cached_request serves the stale response if one exists.
+        if not get_daily_quota().consume("fatsecret-platform", self.daily_quota):
+            raise PlatformLocationQuotaError("FatSecret Platform: cuota diaria agotada.")
+
+    def _token_valid(self, margin: float = 60.0) -> bool:
+        return bool(self._access_token) and (time.time() + margin) < self._token_expiry
+
+    def _adopt_shared_token(self) -> None:
+        # Another process (or an earlier client instance) may already hold a fresh token.
+        shared = get_token_store().get(self._token_key)
+        if shared and shared[1] > self._token_expiry:
+            self._access_token, self._token_expiry = shared
+            self._schedule_refresh()
 
     def _ensure_token(self) -> str:
-        margin = 60.0
-        if self._access_token and (time.time() + margin) < self._token_expiry:
+        if not self._token_valid():
+            self._adopt_shared_token()
+        if self._token_valid():
+            self._refresh_ahead()
             return self._access_token
-        return self._fetch_token()
+        return self._refresh_token()
 
-    def _fetch_token(self) -> str:
+    def _refresh_token(self, margin: float = 60.0) -> str:
+        """
+        Fetches a token while holding the shared store lock, so concurrent processes
+        make a single request and the rest adopt its result.
+        """
+        with get_token_store().locked():
+            self._adopt_shared_token()
+            if self._token_valid(margin):
+                return self._access_token
+            return self._fetch_token()
+
+    def _schedule_refresh(self) -> None:
+        """
+        Arms a timer that refreshes the token TOKEN_REFRESH_AHEAD before it expires, so
+        requests keep finding a valid token even after idle periods. The check in
+        :meth:`_ensure_token` remains as a fallback, e.g. after the machine slept.
+        """
+        delay = self._token_expiry - TOKEN_REFRESH_AHEAD - time.time()
+        timer = None
+        # Tokens this short-lived are refreshed on request; a timer would refetch them in a loop.
+        if delay > 0:
+            timer = threading.Timer(delay + 1.0, self._refresh_ahead)
+            timer.daemon = True
+        with self._refresh_lock:
+            previous, self._refresh_timer = self._refresh_timer, timer
+        if previous is not None:
+            previous.cancel()
+        if timer is not None:
+            timer.start()
+
+    def _refresh_ahead(self) -> None:
+        if self._token_valid(TOKEN_REFRESH_AHEAD):
+            return
+        with self._refresh_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run() -> None:
+            try:
+                with request_lane(BACKGROUND):
+                    self._refresh_token(TOKEN_REFRESH_AHEAD)
+            except PlatformLocationError:
+                pass
+            finally:
+                with self._refresh_lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="platform-token-refresh", daemon=True).start()
+
+    def _token_request(self) -> Tuple[bytes, Dict[str, str]]:
         credentials = f"{self.client_id}:{self.client_secret}"
         encoded_credentials = base64.b64encode(credentials.encode("utf-8")).decode("ascii")
 
@@ -118,19 +226,24 @@ class FatSecretPlatformClient:
 
         data = urllib.parse.urlencode(body).encode("utf-8")
 
-        req = urllib.request.Request(TOKEN_URL, data=data, method="POST")
-        req.add_header("Content-Type", "application/x-www-form-urlencoded")
-        req.add_header("Authorization", f"Basic {encoded_credentials}")
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Authorization": f"Basic {encoded_credentials}",
+        }
+        return data, headers
 
+    def _fetch_token(self) -> str:
+        data, headers = self._token_request()
+        self._throttle()
         try:
-            with urllib.request.urlopen(req, timeout=self.timeout) as response:
-                payload = json.loads(response.read().decode("utf-8"))
-        except urllib.error.HTTPError as exc:
-            message = exc.read().decode("utf-8", errors="ignore")
-            raise PlatformLocationError(f"Auth HTTP {exc.code}: {message}") from exc
+            payload = get_transport().request("POST", TOKEN_URL, headers=headers, body=data, timeout=self.timeout).json()
+        except HttpStatusError as exc:
+            raise PlatformLocationError(f"Auth HTTP {exc.code}: {exc.text()}") from exc
         except Exception as exc:
             raise PlatformLocationError(str(exc)) from exc
+        return self._store_token(payload)
 
+    def _store_token(self, payload: Dict) -> str:
         token = payload.get("access_token")
         expires_in = float(payload.get("expires_in", 3600))
         if not token:
@@ -138,9 +251,40 @@ class FatSecretPlatformClient:
 
         self._access_token = token
         self._token_expiry = time.time() + max(expires_in, 60.0)
+        get_token_store().put(self._token_key, token, self._token_expiry)
+        self._schedule_refresh()
         return token
 
 
+def _api_url(params: Dict[str, str]) -> str:
+    return f"{API_URL}?{urllib.parse.urlencode(params)}"
+
+
+def _api_headers(token: str) -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/json",
+    }
+
+
+def _parse_api_payload(data: str) -> Dict:
+    try:
+        payload = json.loads(data)
+    except json.JSONDecodeError as exc:
+        raise PlatformLocationError("Invalid JSON payload from Platform API.") from exc
+
+    if isinstance(payload, dict) and "error" in payload:
+        error = payload["error"]
+        if isinstance(error, dict):
+            message = error.get("message") or error.get("code") or "Unknown error"
+        else:
+            message = str(error)
+        exc = PlatformLocationError(message)
+        exc.provider_failure = is_provider_error(error)
+        raise exc
+    return payload
+
+
 def _normalise_locales_payload(payload: Union[Dict, List]) -> List[Dict]:
     if isinstance(payload, list):
         return [item for item in payload if isinstance(item, dict)]
@@ -178,6 +322,7 @@ _cached_client: Optional[FatSecretPlatformClient] = None
 _cached_client_config: Optional[Tuple[str, str, Optional[str], Optional[str]]] = None
 _cached_locales: Tuple[List[Dict], float] = ([], 0.0)
 _LOCALES_TTL = 6 * 60 * 60  # 6 hours
+_locales_flight = SingleFlight()
 
 
 def _get_client() -> FatSecretPlatformClient:
@@ -207,23 +352,101 @@ def _get_client() -> FatSecretPlatformClient:
     return _cached_client
 
 
-def get_platform_locales(force_refresh: bool = False) -> List[Dict]:
-    global _cached_locales
+def _locales_cache_path() -> Path:
+    path = os.getenv("MACROENTRENO_LOCALES_CACHE_PATH")
+    return Path(path) if path else LOCALES_CACHE_PATH
 
-    now = time.time()
-    locales, cached_at = _cached_locales
-    if locales and not force_refresh and (now - cached_at) < _LOCALES_TTL:
-        return locales
 
-    client = _get_client()
-    locales = client.list_locales()
+def _read_locales_cache() -> Tuple[List[Dict], float]:
+    try:
+        data = json.loads(_locales_cache_path().read_text(encoding="utf-8"))
+        locales = data.get("locales")
+        if isinstance(locales, list):
+            return locales, float(data.get("fetched_at") or 0.0)
+    except (OSError, ValueError, TypeError, AttributeError):
+        pass
+    return [], 0.0
+
+
+def _write_locales_cache(locales: List[Dict], fetched_at: float) -> None:
+    path = _locales_cache_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps({"fetched_at": fetched_at, "locales": locales}, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
 
+def get_cached_platform_locales() -> Tuple[List[Dict], float]:
+    """
+    Last known locales and when they were fetched, from memory or disk; never hits the network.
+    """
+    global _cached_locales
+    locales, fetched_at = _cached_locales
+    if not locales:
+        locales, fetched_at = _read_locales_cache()
+        if locales:
+            _cached_locales = (locales, fetched_at)
+    return locales, fetched_at
+
+
+def _fetch_platform_locales() -> List[Dict]:
+    global _cached_locales
+    locales = _get_client().list_locales()
+    now = time.time()
     _cached_locales = (locales, now)
+    _write_locales_cache(locales, now)
     return locales
 
 
+def get_platform_locales(force_refresh: bool = False) -> List[Dict]:
+    locales, cached_at = get_cached_platform_locales()
+    if locales and not force_refresh and (time.time() - cached_at) < _LOCALES_TTL:
+        return locales
+    return _locales_flight.do("locales", _fetch_platform_locales)
+
+
 def get_platform_locale_summary(limit: int = 6, force_refresh: bool = False) -> List[str]:
-    locales = get_platform_locales(force_refresh=force_refresh)
+    return summarise_locales(get_platform_locales(force_refresh=force_refresh), limit)
+
+
+def get_cached_platform_locale_summary(limit: int = 6) -> Tuple[List[str], bool]:
+    """
+    Summary of the cached locales and whether they are stale (missing or older than the TTL).
+    """
+    locales, fetched_at = get_cached_platform_locales()
+    stale = not locales or (time.time() - fetched_at) >= _LOCALES_TTL
+    return summarise_locales(locales, limit), stale
+
+
+def revalidate_platform_locales(
+    on_done: Callable[[List[str], Optional[Exception]], None],
+    *,
+    limit: int = 6,
+) -> threading.Thread:
+    """
+    Refreshes the locales on a background thread (background rate-limit lane) and calls
+    ``on_done(summary, None)``, or ``on_done([], error)`` when the refresh fails.
+    Concurrent revalidations share one request.
+    """
+
+    def run() -> None:
+        try:
+            with request_lane(BACKGROUND):
+                locales = _locales_flight.do("locales", _fetch_platform_locales)
+        except PlatformLocationError as exc:
+            on_done([], exc)
+            return
+        on_done(summarise_locales(locales, limit), None)
+
+    thread = threading.Thread(target=run, name="platform-locales", daemon=True)
+    thread.start()
+    return thread
+
+
+def summarise_locales(locales: List[Dict], limit: int = 6) -> List[str]:
     summary: List[str] = []
 
     for locale in locales:
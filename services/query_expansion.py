@@ -0,0 +1,80 @@
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from data.synonyms import FOOD_SYNONYMS
+from services.food_merge import normalise_text
+
+
+# Rewritten queries score at this fraction of a literal match. Text scores top out
+# below 2.0, so every synonym hit (< 0.9) stays under any literal substring match (>= 0.9).
+SYNONYM_WEIGHT = 0.45
+MAX_EXPANSIONS = 8
+
+
+@lru_cache
+def _synonym_table() -> Tuple[Dict[str, int], List[List[str]], int]:
+    """
+    Compiles FOOD_SYNONYMS once: normalised phrase -> group id, the groups (catalogue
+    term first) and the longest phrase in words.
+    """
+    phrases: Dict[str, int] = {}
+    groups: List[List[str]] = []
+    longest = 1
+    for term, variants in FOOD_SYNONYMS.items():
+        members: List[str] = []
+        for member in [term, *variants]:
+            member = " ".join(member.lower().split())
+            if member and member not in members:
+                members.append(member)
+        group_id = len(groups)
+        groups.append(members)
+        for member in members:
+            key = normalise_text(member)
+            # A phrase listed in two groups belongs to the first one.
+            phrases.setdefault(key, group_id)
+            longest = max(longest, len(key.split()))
+    return phrases, groups, longest
+
+
+def expand_query(query_l: str) -> List[Tuple[str, float]]:
+    """
+    The lower case query with weight 1.0 followed by its synonym and translation
+    rewrites (weight :data:`SYNONYM_WEIGHT`), e.g. "chicken breast" also searches
+    "pollo pechuga" and "pechuga de pollo". Longer phrases match first.
+    """
+    words = query_l.split()
+    expansions: List[Tuple[str, float]] = [(query_l, 1.0)]
+    if not words:
+        return expansions
+    phrases, groups, longest = _synonym_table()
+    normalised = [normalise_text(word) for word in words]
+
+    spans: List[Tuple[int, int, int]] = []
+    start = 0
+    while start < len(words):
+        for size in range(min(longest, len(words) - start), 0, -1):
+            group_id = phrases.get(" ".join(normalised[start:start + size]))
+            if group_id is not None:
+                spans.append((start, start + size, group_id))
+                start += size
+                break
+        else:
+            start += 1
+
+    seen = {query_l}
+
+    def add(rewrite: str) -> None:
+        if rewrite not in seen and len(expansions) <= MAX_EXPANSIONS:
+            seen.add(rewrite)
+            expansions.append((rewrite, SYNONYM_WEIGHT))
+
+    if len(spans) > 1:
+        # Every matched phrase in its catalogue form, e.g. "yogurt strawberry" -> "yogur frutilla".
+        rewritten = list(words)
+        for begin, end, group_id in reversed(spans):
+            rewritten[begin:end] = [groups[group_id][0]]
+        add(" ".join(rewritten))
+    for begin, end, group_id in spans:
+        for member in groups[group_id]:
+            add(" ".join(words[:begin] + [member] + words[end:]))
+    return expansions
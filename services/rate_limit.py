@@ -0,0 +1,254 @@
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from services.file_lock import FileLock, lock_path_for
+
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+DEFAULT_QUOTA_PATH = Path(__file__).resolve().parent.parent / "data" / "api_quota.json"
+# Share of a daily quota background work may use, so interactive searches keep a reserve.
+BACKGROUND_QUOTA_SHARE = 0.8
+
+_lane: ContextVar[str] = ContextVar("request_lane", default=INTERACTIVE)
+
+
+@contextmanager
+def request_lane(lane: str) -> Iterator[None]:
+    """
+    Runs the enclosed API calls in ``lane`` (INTERACTIVE or BACKGROUND).
+    Background calls yield to interactive ones waiting on the same limiter.
+    """
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_lane() -> str:
+    return _lane.get()
+
+
+class TokenBucket:
+    """
+    Token bucket allowing ``rate`` calls per second with bursts up to ``capacity``.
+    While an interactive caller is waiting, background callers do not take tokens.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = max(float(rate), 0.001)
+        self.capacity = max(float(capacity or rate), 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._waiting_interactive = 0
+        self._cond = threading.Condition()
+        self.granted = 0
+        self.throttled = 0
+        self.timeouts = 0
+
+    def _take(self, lane: str) -> float:
+        """
+        Takes a token and returns 0, or returns how long to wait before retrying. Caller holds the lock.
+        """
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if lane != INTERACTIVE and self._waiting_interactive:
+            return 1.0 / self.rate
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            self.granted += 1
+            return 0.0
+        return (1.0 - self._tokens) / self.rate
+
+    def acquire(self, lane: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        lane = lane or current_lane()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            delay = self._take(lane)
+            if not delay:
+                return True
+            self.throttled += 1
+            if lane == INTERACTIVE:
+                self._waiting_interactive += 1
+            try:
+                while delay:
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timeouts += 1
+                            return False
+                        delay = min(delay, remaining)
+                    self._cond.wait(delay)
+                    delay = self._take(lane)
+                return True
+            finally:
+                if lane == INTERACTIVE:
+                    self._waiting_interactive -= 1
+                    self._cond.notify_all()
+
+    async def acquire_async(self, lane: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Coroutine counterpart of :meth:`acquire`; sleeps on the event loop instead of blocking it.
+        """
+        import asyncio
+
+        lane = lane or current_lane()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            delay = self._take(lane)
+            if not delay:
+                return True
+            self.throttled += 1
+            if lane == INTERACTIVE:
+                self._waiting_interactive += 1
+        try:
+            while delay:
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        with self._cond:
+                            self.timeouts += 1
+                        return False
+                    delay = min(delay, remaining)
+                await asyncio.sleep(delay)
+                with self._cond:
+                    delay = self._take(lane)
+            return True
+        finally:
+            if lane == INTERACTIVE:
+                with self._cond:
+                    self._waiting_interactive -= 1
+                    self._cond.notify_all()
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            return {
+                "rate": self.rate,
+                "capacity": self.capacity,
+                "tokens": round(self._tokens, 2),
+                "granted": self.granted,
+                "throttled": self.throttled,
+                "timeouts": self.timeouts,
+            }
+
+
+def _today() -> str:
+    # API quotas reset at midnight UTC.
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+class DailyQuota:
+    """
+    Per-day call counters for each API, persisted to a JSON file so restarts do not
+    forget the usage. Writes are batched every ``flush_every`` calls and at exit; each
+    flush adds this process's new calls to the counts on disk under a cross-process
+    file lock, so several app instances share one budget instead of overwriting it.
+    """
+
+    def __init__(self, path: Path = DEFAULT_QUOTA_PATH, *, flush_every: int = 10):
+        self.path = Path(path)
+        self.flush_every = max(1, int(flush_every))
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(lock_path_for(self.path))
+        self._day = _today()
+        self._used: Dict[str, int] = self._read_disk()
+        # Calls counted since the last flush, not yet on disk.
+        self._pending: Dict[str, int] = {}
+        self._dirty = 0
+
+    def _read_disk(self) -> Dict[str, int]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get("day") != self._day:
+            return {}
+        return {str(k): int(v) for k, v in (data.get("used") or {}).items()}
+
+    def _roll_day(self) -> None:
+        today = _today()
+        if today != self._day:
+            self._day = today
+            self._used = {}
+            self._pending = {}
+            self._dirty = 0
+
+    def consume(self, name: str, limit: int, lane: Optional[str] = None) -> bool:
+        """
+        Counts one call against ``name``; returns False (without counting) once the
+        lane's share of ``limit`` is spent. A limit <= 0 means unlimited.
+        """
+        lane = lane or current_lane()
+        with self._lock:
+            self._roll_day()
+            used = self._used.get(name, 0)
+            if limit > 0:
+                allowed = limit if lane == INTERACTIVE else int(limit * BACKGROUND_QUOTA_SHARE)
+                if used >= allowed:
+                    return False
+            self._used[name] = used + 1
+            self._pending[name] = self._pending.get(name, 0) + 1
+            self._dirty += 1
+            if self._dirty >= self.flush_every:
+                self._flush_locked()
+        return True
+
+    def used(self, name: str) -> int:
+        with self._lock:
+            self._roll_day()
+            return self._used.get(name, 0)
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._dirty:
+                self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        try:
+            with self._file_lock.locked():
+                # Re-read under the file lock: other processes may have flushed since our last look.
+                used = self._read_disk()
+                for name, count in self._pending.items():
+                    used[name] = used.get(name, 0) + count
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+                tmp_path.write_text(json.dumps({"day": self._day, "used": used}, indent=2), encoding="utf-8")
+                os.replace(tmp_path, self.path)
+        except OSError:
+            return
+        self._used = used
+        self._pending = {}
+        self._dirty = 0
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            self._roll_day()
+            return {"day": self._day, "used": dict(self._used)}
+
+
+_quota: Optional[DailyQuota] = None
+_quota_lock = threading.Lock()
+
+
+def get_daily_quota() -> DailyQuota:
+    """
+    Shared quota ledger; MACROENTRENO_QUOTA_PATH moves the file.
+    """
+    global _quota
+    with _quota_lock:
+        if _quota is None:
+            path = os.getenv("MACROENTRENO_QUOTA_PATH")
+            _quota = DailyQuota(Path(path) if path else DEFAULT_QUOTA_PATH)
+            atexit.register(_quota.flush)
+        return _quota
@@ -0,0 +1,101 @@
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+    Callers that arrive while a call is in flight wait for it and receive the same
+    result (or exception) instead of issuing their own request. Results are shared,
+    so callers must copy them before mutating.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # asyncio and concurrent.futures are imported on first use; they are slow to import.
+        self._calls: Dict[Hashable, "Future[Any]"] = {}
+        self._async_calls: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self.calls = 0
+        self.executions = 0
+        self.deduplicated = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        from concurrent.futures import Future
+
+        with self._lock:
+            self.calls += 1
+            future = self._calls.get(key)
+            if future is not None:
+                self.deduplicated += 1
+                leader = False
+            else:
+                future = Future()
+                self._calls[key] = future
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Coroutine counterpart of :meth:`do` for callers on one event loop.
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        scoped_key = (id(loop), key)
+        with self._lock:
+            self.calls += 1
+            future = self._async_calls.get(scoped_key)
+            if future is not None:
+                self.deduplicated += 1
+            else:
+                future = loop.create_future()
+                self._async_calls[scoped_key] = future
+                self.executions += 1
+                future.add_done_callback(lambda done: self._forget_async(scoped_key, done))
+                # Followers must not be cancelled when the leader's task is, so the
+                # upstream call runs in its own task.
+                task = loop.create_task(fn())
+                task.add_done_callback(lambda done: _transfer(done, future))
+        return await asyncio.shield(future)
+
+    def _forget_async(self, key: Hashable, future: "asyncio.Future[Any]") -> None:
+        with self._lock:
+            self._async_calls.pop(key, None)
+        # Mark the outcome as retrieved even if every waiter was cancelled.
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "deduplicated": self.deduplicated,
+                "in_flight": len(self._calls) + len(self._async_calls),
+            }
+
+
+def _transfer(task: "asyncio.Task[Any]", future: "asyncio.Future[Any]") -> None:
+    if future.done():
+        return
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import ContextManager, Dict, Optional, Tuple
+
+from services.file_lock import FileLock, lock_path_for
+
+
+DEFAULT_TOKEN_STORE_PATH = Path(__file__).resolve().parent.parent / "data" / "oauth_tokens.json"
+
+
+def token_key(client_id: str, scope: Optional[str]) -> str:
+    """
+    Store key for a client id and scope; the client id itself is not written to disk.
+    """
+    return hashlib.sha256(f"{client_id}\0{scope or ''}".encode("utf-8")).hexdigest()[:32]
+
+
+class TokenStore:
+    """
+    OAuth access tokens shared by every process on the machine through a JSON file.
+    :meth:`locked` holds an exclusive lock on a sidecar ``.lock`` file (flock on POSIX,
+    msvcrt on Windows), so only one process fetches a new token while the others wait
+    and then reuse it.
+    """
+
+    def __init__(self, path: Path = DEFAULT_TOKEN_STORE_PATH):
+        self.path = Path(path)
+        self._file_lock = FileLock(lock_path_for(self.path))
+
+    def locked(self) -> ContextManager[None]:
+        return self._file_lock.locked()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        entry = self._read().get(key)
+        if not isinstance(entry, dict) or not entry.get("access_token"):
+            return None
+        try:
+            return str(entry["access_token"]), float(entry.get("expires_at") or 0.0)
+        except (TypeError, ValueError):
+            return None
+
+    def put(self, key: str, token: str, expires_at: float) -> None:
+        with self.locked():
+            tokens = self._read()
+            tokens[key] = {"access_token": token, "expires_at": expires_at}
+            self._write(tokens)
+
+    def _read(self) -> Dict[str, Dict]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _write(self, tokens: Dict[str, Dict]) -> None:
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        try:
+            # Bearer tokens: readable by the owner only.
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                json.dump(tokens, handle)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+
+_store: Optional[TokenStore] = None
+_store_lock = threading.Lock()
+
+
+def get_token_store() -> TokenStore:
+    """
+    Shared store; MACROENTRENO_TOKEN_STORE_PATH moves the file.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            path = os.getenv("MACROENTRENO_TOKEN_STORE_PATH")
+            _store = TokenStore(Path(path) if path else DEFAULT_TOKEN_STORE_PATH)
+        return _store
@@ -0,0 +1,338 @@
+import csv
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from services.barcodes import normalise_barcode
+from services.catalog_mmap import CatalogWriter, MappedCatalog
+from services.foods import MAPPED_CATALOG_PATH
+from services.usda_nutrients import NUTRIENT_MAP, extract_usda_macros
+
+
+# Bulk downloads from https://fdc.nal.usda.gov/download-datasets: JSON files hold a single
+# top-level array (SRLegacyFoods, SurveyFoods, BrandedFoods, ...); unzipped CSV folders are
+# filtered to these food.csv data types.
+CSV_DATA_TYPES = {"sr_legacy_food", "survey_fndds_food", "branded_food"}
+_CHUNK_SIZE = 1 << 20
+_INSERT_BATCH = 5000
+
+
+def iter_json_foods(path: Path, *, chunk_size: int = _CHUNK_SIZE) -> Iterator[Dict]:
+    """
+    Yields the foods of an FDC JSON download one at a time.
+    Only the current chunk and the food being decoded are kept in memory, so
+    multi-GB files such as the Branded dataset stream with bounded memory.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as fh:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def fill() -> bool:
+            nonlocal buffer, pos, eof
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        while True:
+            start = buffer.find("[", pos)
+            if start >= 0:
+                pos = start + 1
+                break
+            pos = len(buffer)
+            if not fill():
+                return
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                if not fill():
+                    return
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The food is split across chunks; read more and retry.
+                if eof or not fill():
+                    raise
+                continue
+            pos = end
+            if isinstance(item, dict):
+                yield item
+
+
+def _json_nutrients(food: Dict) -> List[Dict]:
+    # Bulk files nest nutrient metadata; reshape it like the search API so the same extraction applies.
+    nutrients = []
+    for entry in food.get("foodNutrients") or []:
+        nutrient = entry.get("nutrient") or {}
+        nutrients.append(
+            {
+                "nutrientName": nutrient.get("name"),
+                "unitName": nutrient.get("unitName"),
+                "value": entry.get("amount"),
+            }
+        )
+    return nutrients
+
+
+def _catalog_item(
+    fdc_id,
+    description: Optional[str],
+    nutrients: List[Dict],
+    *,
+    brand: Optional[str] = None,
+    category: Optional[str] = None,
+    barcode: Optional[str] = None,
+) -> Optional[Dict]:
+    macros = extract_usda_macros(nutrients)
+    if not macros:
+        return None
+    item = {
+        "id": f"usda-{fdc_id}",
+        "name": (description or "Alimento USDA").title(),
+        "source": "usda",
+        "portion": {"grams": 100, "description": "por 100 g"},
+        "macros": macros,
+    }
+    if brand:
+        item["brand"] = brand
+    if category:
+        item["category"] = category
+    # Branded foods carry their GTIN/UPC, so scanned products resolve offline.
+    code = normalise_barcode(barcode) if barcode else None
+    if code:
+        item["barcode"] = code
+    return item
+
+
+def json_catalog_items(path: Path) -> Iterator[Dict]:
+    for food in iter_json_foods(path):
+        category = food.get("brandedFoodCategory") or (food.get("foodCategory") or {}).get("description")
+        item = _catalog_item(
+            food.get("fdcId"),
+            food.get("description"),
+            _json_nutrients(food),
+            brand=food.get("brandName") or food.get("brandOwner"),
+            category=category,
+            barcode=food.get("gtinUpc"),
+        )
+        if item:
+            yield item
+
+
+def csv_catalog_items(folder: Path, *, data_types: Iterable[str] = CSV_DATA_TYPES) -> Iterator[Dict]:
+    """
+    Yields foods from an unzipped FDC CSV folder.
+    food_nutrient.csv is not ordered by food, so the macro rows are first staged in a
+    temporary SQLite database on disk; memory stays bounded whatever the dataset size.
+    """
+    folder = Path(folder)
+    data_types = set(data_types)
+    nutrient_names = _read_macro_nutrients(folder / "nutrient.csv")
+    categories = _read_categories(folder / "food_category.csv")
+
+    tmp_dir = tempfile.mkdtemp(prefix="macroentreno-usda-")
+    db_path = os.path.join(tmp_dir, "stage.sqlite3")
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("CREATE TABLE nutrients (fdc_id INTEGER, name TEXT, unit TEXT, amount REAL)")
+        conn.execute("CREATE TABLE brands (fdc_id INTEGER PRIMARY KEY, brand TEXT, category TEXT, gtin TEXT)")
+
+        _stage_rows(
+            conn,
+            "INSERT INTO nutrients VALUES (?, ?, ?, ?)",
+            (
+                (int(row["fdc_id"]), *nutrient_names[row["nutrient_id"]], _to_float(row.get("amount")))
+                for row in _read_csv(folder / "food_nutrient.csv")
+                if row.get("nutrient_id") in nutrient_names
+            ),
+        )
+        branded_path = folder / "branded_food.csv"
+        if branded_path.exists():
+            _stage_rows(
+                conn,
+                "INSERT OR REPLACE INTO brands VALUES (?, ?, ?, ?)",
+                (
+                    (
+                        int(row["fdc_id"]),
+                        row.get("brand_name") or row.get("brand_owner") or None,
+                        row.get("branded_food_category") or None,
+                        row.get("gtin_upc") or None,
+                    )
+                    for row in _read_csv(branded_path)
+                ),
+            )
+        conn.execute("CREATE INDEX nutrients_fdc ON nutrients (fdc_id)")
+
+        for row in _read_csv(folder / "food.csv"):
+            if row.get("data_type") not in data_types:
+                continue
+            fdc_id = int(row["fdc_id"])
+            nutrients = [
+                {"nutrientName": name, "unitName": unit, "value": amount}
+                for name, unit, amount in conn.execute(
+                    "SELECT name, unit, amount FROM nutrients WHERE fdc_id = ?",
+                    (fdc_id,),
+                )
+            ]
+            brand_row = conn.execute("SELECT brand, category, gtin FROM brands WHERE fdc_id = ?", (fdc_id,)).fetchone()
+            if brand_row:
+                brand, category, gtin = brand_row
+            else:
+                brand, category, gtin = None, categories.get(row.get("food_category_id") or ""), None
+            item = _catalog_item(
+                fdc_id, row.get("description"), nutrients, brand=brand, category=category, barcode=gtin
+            )
+            if item:
+                yield item
+    finally:
+        conn.close()
+        try:
+            os.remove(db_path)
+            os.rmdir(tmp_dir)
+        except OSError:
+            pass
+
+
+def _read_csv(path: Path) -> Iterator[Dict[str, str]]:
+    with open(path, "r", encoding="utf-8", newline="") as fh:
+        yield from csv.DictReader(fh)
+
+
+def _read_macro_nutrients(path: Path) -> Dict[str, Tuple[str, str]]:
+    # CSV units are upper case ("KCAL"); the API and JSON files use "kcal".
+    return {
+        row["id"]: (row["name"], (row.get("unit_name") or "").lower())
+        for row in _read_csv(path)
+        if row.get("name") in NUTRIENT_MAP
+    }
+
+
+def _read_categories(path: Path) -> Dict[str, str]:
+    if not path.exists():
+        return {}
+    return {row["id"]: row.get("description") or "" for row in _read_csv(path)}
+
+
+def _stage_rows(conn: sqlite3.Connection, sql: str, rows: Iterable[Tuple]) -> None:
+    batch: List[Tuple] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= _INSERT_BATCH:
+            conn.executemany(sql, batch)
+            batch.clear()
+    if batch:
+        conn.executemany(sql, batch)
+    conn.commit()
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_catalog_items(path: Path) -> Iterator[Dict]:
+    path = Path(path)
+    if path.is_dir():
+        return csv_catalog_items(path)
+    return json_catalog_items(path)
+
+
+class _SeenIds:
+    """
+    Ids of the foods written so far, staged in a temporary SQLite file so memory stays
+    bounded however large the import is.
+    """
+
+    def __init__(self):
+        self._tmp_dir = tempfile.mkdtemp(prefix="macroentreno-usda-")
+        self._conn = sqlite3.connect(os.path.join(self._tmp_dir, "ids.sqlite3"))
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("CREATE TABLE ids (id TEXT PRIMARY KEY) WITHOUT ROWID")
+        # Ids not inserted yet; checked directly so lookups do not force a flush per food.
+        self._batch: Set[str] = set()
+
+    def add(self, food_id: str) -> None:
+        self._batch.add(food_id)
+        if len(self._batch) >= _INSERT_BATCH:
+            self._flush()
+
+    def __contains__(self, food_id: str) -> bool:
+        if food_id in self._batch:
+            return True
+        return self._conn.execute("SELECT 1 FROM ids WHERE id = ?", (food_id,)).fetchone() is not None
+
+    def _flush(self) -> None:
+        if self._batch:
+            self._conn.executemany("INSERT OR IGNORE INTO ids VALUES (?)", ((food_id,) for food_id in self._batch))
+            self._batch.clear()
+
+    def close(self) -> None:
+        self._conn.close()
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+
+def import_usda(sources: Iterable[Path], output: Path = MAPPED_CATALOG_PATH, *, replace: bool = False) -> int:
+    """
+    Streams one or more FDC downloads (JSON files or CSV folders) into a mapped
+    catalogue at ``output``, which local search then serves without the USDA API.
+    Foods already in ``output`` are kept unless ``replace`` is set: rows whose id the
+    import does not bring are copied after the imported ones, so re-importing a
+    dataset refreshes its foods without dropping the rest. A food listed more than
+    once (in one source or across sources) is written once, from its first listing.
+    """
+    output = Path(output)
+    existing = MappedCatalog(output) if not replace and output.exists() else None
+    seen = _SeenIds()
+    try:
+        with CatalogWriter(output) as writer:
+            for source in sources:
+                for item in iter_catalog_items(source):
+                    if item["id"] in seen:
+                        continue
+                    seen.add(item["id"])
+                    writer.add(item)
+            if existing is not None:
+                for pos in range(len(existing)):
+                    # Recorded too, which also cleans duplicates out of older catalogues.
+                    food_id = existing.food_id(pos)
+                    if food_id not in seen:
+                        seen.add(food_id)
+                        writer.add(existing.record(pos))
+                # The writer replaces ``output`` on exit; release the mapping first.
+                existing.close()
+                existing = None
+    finally:
+        if existing is not None:
+            existing.close()
+        seen.close()
+    return writer.count
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != "--replace"]
+    if len(args) < 2:
+        print("Uso: python -m services.usda_import [--replace] <salida.bin> <fdc.json|carpeta_csv> [...]")
+        print("Sin --replace se conservan los alimentos que ya tenia el catalogo de salida.")
+        sys.exit(1)
+    written = import_usda([Path(arg) for arg in args[1:]], Path(args[0]), replace="--replace" in sys.argv[1:])
+    print(f"{written} alimentos USDA escritos en {args[0]}")
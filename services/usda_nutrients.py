@@ -0,0 +1,42 @@
+from typing import Dict, List, Optional
+
+
+# FoodData Central nutrient names -> macro keys, shared by the search API and bulk imports.
+NUTRIENT_MAP = {
+    "Protein": "p",
+    "Carbohydrate, by difference": "c",
+    "Total lipid (fat)": "g",
+    "Energy": "kcal",
+}
+
+
+def extract_usda_macros(nutrients: List[Dict]) -> Optional[Dict[str, float]]:
+    """
+    Macros per 100 g from FDC nutrient entries (``nutrientName``/``unitName``/``value``),
+    or None when none of them is present. Missing energy is derived from the macros.
+    """
+    if not nutrients:
+        return None
+
+    macros: Dict[str, float] = {"kcal": 0.0, "p": 0.0, "c": 0.0, "g": 0.0}
+    for nutrient in nutrients:
+        name = nutrient.get("nutrientName")
+        unit = nutrient.get("unitName")
+        if name not in NUTRIENT_MAP:
+            continue
+        key = NUTRIENT_MAP[name]
+        value = nutrient.get("value")
+        if value is None:
+            continue
+        if key == "kcal" and unit != "kcal":
+            continue
+        macros[key] = float(value)
+
+    if macros["kcal"] == 0.0 and any(macros[k] for k in ("p", "c", "g")):
+        macros["kcal"] = round(
+            macros["p"] * 4 + macros["c"] * 4 + macros["g"] * 9, 0
+        )
+
+    if not any(macros.values()):
+        return None
+    return macros